@@ -127,6 +127,15 @@ class Configuration:
     SHOW_GRID = $SHOW_GRID              # Show grid in plots
     TIME_UNITS = "ms"
     PLOT_WIDTH = "all"  # "all" "rising" "falling" None
+    RENDER_ENGINE = "edges"  # "samples" "edges" "minmax"
+    FIGURE_POOL = True  # Reuse report figures instead of building them anew
+    RENDER_BINS_PER_PIXEL = 4  # Min/max bins per axes pixel
+    ANNOTATION_ENGINE = "batched"  # "artists" "batched"
+    LABEL_SPACING = 4  # Min gap between pulse width labels in pixels
+    RASTER_TRACES = False  # Embed signal traces as images, the rest as vectors
+    RASTER_DPI = 200  # Resolution of rasterized traces
+    RASTER_MIN_DPI = 72  # Lowest resolution to fit the figure PDF budget
+    FIGURE_PDF_BUDGET = 512 * 1024  # Max figure PDF bytes, 0 for no limit
 
     # Define GPIO pin numbers
     LED_PIN = $LED_PIN
@@ -138,6 +147,7 @@ class Configuration:
 
     # Signal Processing
     FILTER_WSIZE = $FILTER_WSIZE
+    FILTER_ENGINE = "edges"  # "edges" "majority" "medfilt"
 
     # Data Capture
     REAL_CAPTURE = $REAL_CAPTURE          # Real capturing is not available yet
@@ -156,26 +166,84 @@ class Configuration:
         "--samples",
         "4096",
     ]
+    STREAM_CAPTURE = False  # Parse sigrok-cli output while capturing
+    STREAM_MONITOR = False  # Log running pulse counts while streaming
+    CAPTURE_CHUNK_SIZE = 65536  # Bytes read from sigrok-cli pipe at once
+    CAPTURE_FORMAT = "csv"  # "csv" "binary"
+    BINARY_UNITSIZE = 4  # Bytes per sample in sigrok-cli binary output
+    REPLAY_CHUNK_SIZE = 1048576  # Samples per window of memory-mapped replay
     MAX_CAPTURE_ATTEMPTS = 3
     RETRY_DELAY_SECONDS = 2
     
     # Reporting
     ATTEMPT_POINT = (470, 767)    # XY point of attempt number in report canvas
     DATE_POINT = (470, 752)       # XY point of date in report canvas
+    PAGE_NUMBER_POINT = (470, 737) # XY point of page number in report canvas
+    METRICS_POINT = (40, 20)      # XY point of stage timings in report canvas
+    METRICS_FONT_SIZE = 6
+    PULSE_STATS = True # Add a pulse statistics table and CSV to reports
+    TABLE_POINT = (40, 700) # XY point of the first table in report canvas
+    TABLE_FONT_SIZE = 8
     CURRENT_DATE = datetime.now().strftime("%Y-%m-%d")
 
+    # Startup
+    PRELOAD = True  # Import and warm up heavy modules in the background
+
+    # Pipeline
+    PIPELINE_MODE = False  # Render and write reports in background workers
+    PIPELINE_WORKERS = 2  # Worker processes rendering reports
+    PIPELINE_QUEUE_SIZE = 2  # Reports waiting to be written
+
+    # Report Pages
+    REPORT_PAGES = False  # Split long captures into pages rendered in parallel
+    PAGE_SAMPLES = 100000  # Samples per page, 0 for whole captures
+    PAGE_CHANNELS = 10  # Channels per page, 0 for all channels
+    PAGE_WORKERS = os.cpu_count() or 1  # Worker processes rendering pages
+
+    # Channel Timing
+    CHANNEL_TIMING = True  # Add a channel pair timing table and CSV to reports
+    TIMING_PAIRS = None  # [("AS4_2", "AS4_4"), ...], None for all AS*_2 / AS*_4 pairs
+
+    # Report Writing
+    WRITE_BEHIND = True  # Stage reports in RAM and write them in the background
+    STAGING_DIR = "/dev/shm/analyzer_reporter"  # Staged reports, on tmpfs
+    FLUSH_RETRY_INTERVAL = 2  # Seconds between writes while the drive is away
+    FLUSH_MAX_ATTEMPTS = 5  # Failed writes to the drive before a report is moved aside
+    FAILED_DIR = "/var/tmp/analyzer_reporter/failed"  # Unwritable reports
+
+    # Result Cache
+    CACHE_ENABLED = False  # Reuse results of captures processed before
+    CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "analyzer_reporter")
+    CACHE_SIZE_LIMIT = 200 * 1024 * 1024  # 200MB
+
+    # Capture Archive
+    ARCHIVE_CAPTURES = False  # Save raw captures with pulse tables next to reports
+    ARCHIVE_COMPRESS = False  # Deflate archives, disables memory-mapped loading
+
+    # Metrics
+    METRICS_ENABLED = True  # Measure stages of every capture and report
+    METRICS_MEMORY = False  # Also trace memory of stages, slows processing
+    METRICS_FOOTER = False  # Print stage timings in the report footer
+    METRICS_FILE_SIZE = 1048576  # Bytes of the metrics file before it is rotated
+    METRICS_FILE_BACKUPS = 3  # Number of rotated metrics files kept
+
     # USB Storage
     USB_DEVICE = "$USB_DEVICE"            # Change it to sda on Raspberry Pi
     USB_PART = USB_DEVICE + "1"
     USB_DRIVE = os.path.join("/dev", USB_PART)
     WRITE_TRESHOLD = $WRITE_THRESHOLD       # 100KB
+    USB_WATCH_EVENTS = True  # Also wake on mount table events while polling
+    USB_POLL_INTERVAL = 0.5  # Seconds between probes while waiting for the drive
+    USB_RESCAN_INTERVAL = 30  # Seconds between full rescans with mount events
 
     # Paths and Files
     DATA_DIR_NAME = "$DATA_DIR_NAME"
+    REPORT_INDEX_FILE = ".analyzer_reporter_index.json"  # In the USB drive root
     IDX_STR = "{IDX}"
     REPORT_NAME = f'{CURRENT_DATE}-{IDX_STR}.pdf'
     TEMPLATE_FILE = os.path.join(os.path.abspath("$EXAMPLE_DATA_DIR"), "$TEMPLATE_FILE")
     LOG_FILE = os.path.join(os.path.dirname(__file__), "$LOG_FILE")
+    METRICS_FILE = os.path.join(os.path.dirname(__file__), "analyzer_reporter_metrics.jsonl")
 
     # Colors Definition
     COLORS = [
@@ -11,11 +11,24 @@
 import os
 import io
 import time
+import zipfile
 import subprocess
+from typing import Union
+
 import pandas as pd
 
 from config import Configuration as cfg
 from logger import get_cls_logger
+from capture_parser import (
+    CsvStreamParser,
+    BinaryStreamDecoder,
+    read_session_file,
+    command_sample_rate,
+)
+from capture_archive import CaptureArchive
+from replay_source import ReplaySource
+from run_metrics import RunMetrics
+from signal_processor import StreamingSignalProcessor
 
 
 class AnalyzerController:
@@ -31,23 +44,31 @@ class AnalyzerController:
 
         self.logger.debug("Initialized %s", self.__class__.__name__)
 
-    def capture_signals(self) -> pd.DataFrame:
+    def capture_signals(self) -> Union[pd.DataFrame, ReplaySource]:
         """
         Capture signals from Hantek 4032L logic analyzer.
         If real capturing is not available yet, loads sample data from file.
+        A binary sample data file is not loaded but memory-mapped, and its
+        replay source is processed window by window.
         """
         if self.real_capture:
             # Retry capturing for a few attempts if an error occurs
             for attempt in range(1, cfg.MAX_CAPTURE_ATTEMPTS + 1):
                 try:
+                    command = self._build_command()
+                    if cfg.STREAM_CAPTURE or cfg.CAPTURE_FORMAT == "binary":
+                        return self._stream_capture(command)
+
                     # Perform real capturing using sigrok-cli and store the output in a buffer
-                    command = cfg.CAPTURE_COMMAND
-                    with subprocess.Popen(command, stdout=subprocess.PIPE) as process:
+                    with RunMetrics.stage("sigrok"), subprocess.Popen(
+                        command, stdout=subprocess.PIPE
+                    ) as process:
                         output, _ = process.communicate()
                         output_str = output.decode("utf-8")
 
                     # Convert the output to a pandas DataFrame
-                    df = pd.read_csv(io.StringIO(output_str))
+                    with RunMetrics.stage("parse"):
+                        df = pd.read_csv(io.StringIO(output_str))
                     self.logger.debug(
                         "Buffer after sigrok-cli loaded to DataFrame: %s rows",
                         df.shape[0],
@@ -80,9 +101,128 @@ class AnalyzerController:
             return pd.DataFrame()
         # Try to load sample data from file and if error return empty DataFrame
         try:
-            df = pd.read_csv(self.data_path)
+            with RunMetrics.stage("load"):
+                if self.data_path.endswith(".sr"):
+                    df = read_session_file(self.data_path)
+                elif self.data_path.endswith(".npz"):
+                    df = CaptureArchive.load(self.data_path).to_dataframe()
+                elif self.data_path.endswith(".bin"):
+                    df = self.replay_source()
+                else:
+                    df = pd.read_csv(self.data_path)
             self.logger.debug("Data loaded from file: %s", self.data_path)
             return df
-        except (pd.errors.ParserError, FileNotFoundError) as e:
+        except (
+            pd.errors.ParserError,
+            FileNotFoundError,
+            zipfile.BadZipFile,
+            KeyError,
+            ValueError,
+        ) as e:
             self.logger.error("Error occurred while loading sample data: %s", str(e))
             return pd.DataFrame()
+
+    def replay_source(self) -> ReplaySource:
+        """
+        Memory-map the sample data file, a sigrok-cli binary capture with the
+        channels of the capture command, for windowed processing.
+        """
+        channels = self._channel_map(cfg.CAPTURE_COMMAND)
+        return ReplaySource(
+            self.data_path,
+            columns=[label for _, label in channels],
+            bits=[self._channel_bit(probe) for probe, _ in channels],
+            unitsize=cfg.BINARY_UNITSIZE,
+        )
+
+    def _stream_capture(self, command: list) -> pd.DataFrame:
+        """
+        Capture signals parsing sigrok-cli output chunk by chunk while
+        the acquisition is still running.
+        """
+        parser = self._create_parser(command)
+        monitor = None
+        # Output is parsed while sigrok-cli runs, both are one stage
+        with RunMetrics.stage("sigrok"), subprocess.Popen(
+            command, stdout=subprocess.PIPE
+        ) as process:
+            while True:
+                chunk = process.stdout.read1(cfg.CAPTURE_CHUNK_SIZE)
+                if not chunk:
+                    break
+                parser.feed(chunk)
+                if cfg.STREAM_MONITOR and parser.columns:
+                    # Running pulse counts are logged before the capture ends
+                    monitor = monitor or StreamingSignalProcessor(parser.columns)
+                    monitor.feed(parser.decoded(monitor.samples))
+            process.wait()
+
+        if process.returncode:
+            raise subprocess.CalledProcessError(process.returncode, command)
+
+        df = parser.finish()
+        if monitor:
+            monitor.feed(parser.decoded(monitor.samples))
+            monitor.finish()
+        self.logger.debug(
+            "Streamed sigrok-cli output to DataFrame: %s rows", df.shape[0]
+        )
+        return df
+
+    def _build_command(self) -> list:
+        """Get the capture command for the configured output format."""
+        command = list(cfg.CAPTURE_COMMAND)
+        if cfg.CAPTURE_FORMAT == "binary" and "--output-format" in command:
+            command[command.index("--output-format") + 1] = "binary"
+        return command
+
+    def _create_parser(self, command: list) -> object:
+        """Create an incremental parser for the capture command output."""
+        expected_samples = self._expected_samples(command)
+        if cfg.CAPTURE_FORMAT == "binary":
+            channels = self._channel_map(command)
+            return BinaryStreamDecoder(
+                columns=[label for _, label in channels],
+                bits=[self._channel_bit(probe) for probe, _ in channels],
+                unitsize=cfg.BINARY_UNITSIZE,
+                expected_samples=expected_samples,
+            )
+        return CsvStreamParser(expected_samples)
+
+    @staticmethod
+    def _channel_map(command: list) -> list:
+        """Get (probe, label) pairs of the channels enabled in the capture command."""
+        if "--channels" not in command:
+            return []
+        channels = command[command.index("--channels") + 1].split(",")
+        return [(channel.split("=")[0], channel.split("=")[-1]) for channel in channels]
+
+    @staticmethod
+    def _channel_bit(probe: str) -> int:
+        """
+        Get the bit of a probe in a packed binary sample.
+        Hantek 4032L channels are ordered A0-A15, B0-B15.
+        """
+        bank, number = probe[0].upper(), int(probe[1:])
+        return (ord(bank) - ord("A")) * 16 + number
+
+    @classmethod
+    def capture_metadata(cls) -> dict:
+        """Get the channel map and sample rate of the capture command."""
+        command = cfg.CAPTURE_COMMAND
+        return {
+            "channel_map": dict(cls._channel_map(command)),
+            "sample_rate": cls._sample_rate(command),
+        }
+
+    @staticmethod
+    def _sample_rate(command: list) -> str:
+        """Get the sample rate configured in the capture command, None if unset."""
+        return command_sample_rate(command)
+
+    @staticmethod
+    def _expected_samples(command: list) -> int:
+        """Get the number of samples requested in the capture command."""
+        if "--samples" in command:
+            return int(command[command.index("--samples") + 1])
+        return 0
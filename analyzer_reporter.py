@@ -8,18 +8,26 @@
 
 # This file is part of the analyzer_reporter project
 
+import os
 import sys
 import time
 import signal
+from typing import TYPE_CHECKING
 from gpiozero import LED, Button
 
 from config import Configuration as cfg
 from logger import get_cls_logger
 from storage_controller import StorageController
-from analyzer_controller import AnalyzerController
-from signal_processor import SignalProcessor
-from signal_grapher import SignalGrapher
-from report_generator import ReportGenerator
+from usb_watcher import UsbWatcher
+from report_writer import ReportWriter
+from run_metrics import RunMetrics
+from preload import Preloader
+
+# Heavy modules are imported by the preloader, see wait_for_preload()
+if TYPE_CHECKING:
+    from analyzer_controller import AnalyzerController
+
+start_time = time.perf_counter()
 
 # Initialize LED and Button objects
 led = LED(cfg.LED_PIN)
@@ -29,6 +37,22 @@ button = Button(cfg.BUTTON_PIN)
 logger = get_cls_logger(__name__)
 logger.info("Starting Analyzer and Reporter")
 
+# Imports and warms up processing modules, in the background if PRELOAD is on
+preloader = Preloader()
+
+# Background report pipeline, created after the preload in pipelined mode only
+pipeline = None
+
+# Writer of report files to the USB drive, created at start
+report_writer = None
+
+# Processes rendering reports in pipelined mode or pages of paginated reports,
+# forked at start
+workers = None
+
+# Seconds from start until the first ready state
+ready_time = None
+
 
 def sigterm_handler(sig, frame):
     """
@@ -36,6 +60,12 @@ def sigterm_handler(sig, frame):
     """
     logger.info("Received SIGTERM. Exiting...")
     led.off()
+    if pipeline:
+        pipeline.close()
+    if workers:
+        workers.shutdown()
+    if report_writer:
+        report_writer.close()
     sys.exit(0)
 
 
@@ -47,7 +77,7 @@ def log_usb_storage_info(usb_storage: StorageController) -> None:
     usb_storage.logger.debug("USB Mounted: %s", usb_storage.usb_mounted)
     usb_storage.logger.debug("Mount Point: %s", usb_storage.mount_point)
     usb_storage.logger.debug("Data Directory: %s", usb_storage.data_dir)
-    usb_storage.logger.debug("PDF Files: %s", usb_storage.pdf_files)
+    usb_storage.logger.debug("PDF Files: %s", usb_storage.pdf_count)
     usb_storage.logger.debug("Last PDF Report: %s", usb_storage.last_pdf_report)
     usb_storage.logger.debug(
         "Last PDF Report date: %s", usb_storage.last_pdf_report_date
@@ -68,7 +98,7 @@ def print_usb_storage_info(usb_storage: StorageController) -> None:
     print("USB Mounted:", usb_storage.usb_mounted)
     print("Mount Point:", usb_storage.mount_point)
     print("Data Directory:", usb_storage.data_dir)
-    print("PDF Files:", usb_storage.pdf_files)
+    print("PDF Files:", usb_storage.pdf_count)
     print("Last PDF Report:", usb_storage.last_pdf_report)
     print("Last PDF Report date:", usb_storage.last_pdf_report_date)
     print("Last PDF Report index:", usb_storage.last_pdf_report_idx)
@@ -78,7 +108,7 @@ def print_usb_storage_info(usb_storage: StorageController) -> None:
     print("---------------------------------\n")
 
 
-def log_analyzer_controller_info(analyzer_controller: AnalyzerController) -> None:
+def log_analyzer_controller_info(analyzer_controller: "AnalyzerController") -> None:
     """
     Log information about analyzer controller.
     """
@@ -96,24 +126,46 @@ def wait_for_usb_storage_ready(usb_storage: StorageController) -> None:
     log_usb_storage_info(usb_storage)
     if cfg.DEBUG:
         print_usb_storage_info(usb_storage)
-    while not usb_storage.ready_to_write:
-        if usb_storage.changed and not usb_storage.ready_to_write:
-            log_usb_storage_info(usb_storage)
-            if cfg.DEBUG:
-                print_usb_storage_info(usb_storage)
-        time.sleep(0.5)
+    # Watch from before the first rescan so that no change is missed
+    with UsbWatcher() as watcher:
+        while not usb_storage.ready_to_write:
+            if usb_storage.changed and not usb_storage.ready_to_write:
+                log_usb_storage_info(usb_storage)
+                if cfg.DEBUG:
+                    print_usb_storage_info(usb_storage)
+            if not usb_storage.ready_to_write:
+                watcher.wait(usb_storage.mount_point)
+
+
+def log_ready_time() -> None:
+    """
+    Log the time from service start until it is first ready for a button press.
+    """
+    global ready_time  # pylint: disable=global-statement
+    if ready_time is None:
+        ready_time = time.perf_counter() - start_time
+        logger.info("Ready for button press %.2f s after start", ready_time)
+
+
+def wait_for_preload() -> None:
+    """
+    Wait until processing modules are imported and warmed up.
+    """
+    timings = preloader.wait()
+    logger.debug("Preload timings: %s", timings)
 
 
-def main() -> None:
+def main(usb_storage: StorageController) -> None:
     """
     Main function
     """
-    usb_storage = StorageController()
+    usb_storage.update()
 
     if not usb_storage.ready_to_write:
         wait_for_usb_storage_ready(usb_storage)
 
     led.on()  # Turn LED on because relay has vice versa logic
+    log_ready_time()
     log_usb_storage_info(usb_storage)
     if cfg.DEBUG:
         print_usb_storage_info(usb_storage)
@@ -122,47 +174,117 @@ def main() -> None:
     logger.debug("Button pressed!")
     led.blink(on_time=cfg.BLINK_TIME, off_time=cfg.BLINK_TIME)
 
-    analyzer = AnalyzerController()
-    df = analyzer.capture_signals()
-    log_analyzer_controller_info(analyzer)
+    with RunMetrics.run(os.path.basename(usb_storage.current_pdf_report)):
+        with RunMetrics.stage("preload"):
+            wait_for_preload()
+        # pylint: disable=import-outside-toplevel
+        from analyzer_controller import AnalyzerController
+        from report_pipeline import render_report
+        from page_renderer import PageRenderer
 
-    if not df.empty:
-        processor = SignalProcessor(df)
-        processor.logger.debug(
-            "Data processed and loaded to DataFrame: %s rows", df.shape[0]
-        )
+        PageRenderer.executor = workers
 
-        grapher = SignalGrapher(
-            filtered_signals_df=processor.filtered_signals_df,
-            pulse_counts=processor.pulse_count,
-            pulse_points_width=processor.pulse_points_width,
-            rising_signals=processor.rising_signals,
-        )
-        grapher.plot_signals()
-        grapher.logger.debug("Signals and pulses plotted")
-
-        generator = ReportGenerator(
-            figure=grapher.figure,
-            report_file=usb_storage.current_pdf_report,
-            attempt_number=usb_storage.current_pdf_report_idx,
-            capture_date=cfg.CURRENT_DATE,
-        )
+        analyzer = AnalyzerController()
+        with RunMetrics.stage("capture"):
+            df = analyzer.capture_signals()
+        log_analyzer_controller_info(analyzer)
+
+        if not df.empty:
+            with RunMetrics.stage("render"):
+                report_file, files = render_report(
+                    df,
+                    report_file=usb_storage.current_pdf_report,
+                    attempt_number=usb_storage.current_pdf_report_idx,
+                    capture_date=cfg.CURRENT_DATE,
+                )
+            logger.debug("Report %s rendered from %s rows", report_file, len(df))
+
+            if usb_storage.changed:
+                with RunMetrics.stage("usb wait"):
+                    wait_for_usb_storage_ready(usb_storage)
 
-        if usb_storage.changed:
-            wait_for_usb_storage_ready(usb_storage)
+            if usb_storage.ready_to_write:
+                with RunMetrics.stage("write"):
+                    report_writer.write(report_file, files)
+                # Staged reports are not on the drive yet
+                usb_storage.reserve_current_pdf_report()
 
-        if usb_storage.ready_to_write:
-            generator.generate_report()
-            generator.save_pulse_width_csv(processor.pulse_width)
-            generator.logger.debug("Report file %s saved.", generator.report_file)
+
+def main_pipelined(usb_storage: StorageController) -> None:
+    """
+    Main function of the pipelined mode. Only the capture runs here, the
+    report is rendered and written in the background while the next
+    capture is already armed.
+    """
+    global pipeline  # pylint: disable=global-statement
+    usb_storage.update()
+
+    if not usb_storage.ready_to_write:
+        wait_for_usb_storage_ready(usb_storage)
+
+    led.on()  # Turn LED on because relay has vice versa logic
+    log_ready_time()
+    log_usb_storage_info(usb_storage)
+    if cfg.DEBUG:
+        print_usb_storage_info(usb_storage)
+
+    button.wait_for_press(cfg.BUTTON_TIMEOUT)
+    logger.debug("Button pressed!")
+    led.blink(on_time=cfg.BLINK_TIME, off_time=cfg.BLINK_TIME)
+
+    with RunMetrics.run(os.path.basename(usb_storage.current_pdf_report)):
+        with RunMetrics.stage("preload"):
+            wait_for_preload()
+        # pylint: disable=import-outside-toplevel
+        from analyzer_controller import AnalyzerController
+        from report_pipeline import ReportPipeline
+
+        if pipeline is None:
+            pipeline = ReportPipeline(workers, report_writer)
+
+        analyzer = AnalyzerController()
+        with RunMetrics.stage("capture"):
+            df = analyzer.capture_signals()
+        log_analyzer_controller_info(analyzer)
+
+        if not df.empty:
+            # Blocks while the pipeline queue is full
+            with RunMetrics.stage("submit"):
+                pipeline.submit(
+                    df,
+                    report_file=usb_storage.current_pdf_report,
+                    attempt_number=usb_storage.current_pdf_report_idx,
+                    capture_date=cfg.CURRENT_DATE,
+                )
+            usb_storage.reserve_current_pdf_report()
 
 
 if __name__ == "__main__":
     signal.signal(signal.SIGTERM, sigterm_handler)
+    # Workers are forked before the preloader and writer threads start
+    if cfg.PIPELINE_MODE:
+        workers = Preloader.fork_workers(cfg.PIPELINE_WORKERS)
+    elif cfg.REPORT_PAGES and cfg.PAGE_WORKERS > 1:
+        workers = Preloader.fork_workers(cfg.PAGE_WORKERS)
+    if cfg.PRELOAD:
+        preloader.start()
     try:
+        storage = StorageController()
+        report_writer = ReportWriter(
+            on_written=storage.record_report, data_dir=lambda: storage.data_dir
+        )
+        if cfg.PIPELINE_MODE:
+            while True:
+                main_pipelined(storage)
         while True:
-            main()
+            main(storage)
     except KeyboardInterrupt:
         print("Received KeyboardInterrupt. Exiting...")
         led.off()
+        if pipeline:
+            pipeline.close()
+        if workers:
+            workers.shutdown()
+        if report_writer:
+            report_writer.close()
         sys.exit(0)
@@ -0,0 +1,267 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import os
+import sys
+import glob
+import json
+import time
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from config import Configuration as cfg
+from logger import get_cls_logger
+from analyzer_controller import AnalyzerController
+from report_pipeline import render_report
+from report_generator import ReportGenerator
+from report_writer import ReportWriter
+from run_metrics import RunMetrics
+
+# Logger initialization
+logger = get_cls_logger(__name__)
+
+CAPTURE_EXTENSIONS = (".csv", ".sr", ".npz", ".bin")
+PROGRESS_FILE = ".batch_progress.json"
+
+
+def find_captures(inputs: list) -> dict:
+    """
+    Collect capture files from directories, glob patterns and file paths.
+
+    :param inputs: Directories, glob patterns or capture file paths.
+    :return: Paths of capture files relative to their input root, i.e. the
+        directory, the directory part of a glob pattern before its first
+        wildcard or the directory of a file, by their absolute paths, sorted.
+    """
+    captures = {}
+    for item in inputs:
+        if os.path.isdir(item):
+            root = item
+            paths = [os.path.join(item, name) for name in os.listdir(item)]
+        else:
+            root = input_root(item)
+            paths = glob.glob(item)
+        for path in paths:
+            if (
+                path.lower().endswith(CAPTURE_EXTENSIONS)
+                and not path.endswith(tuple(ReportGenerator.OUTPUT_SUFFIXES.values()))
+                and os.path.isfile(path)
+            ):
+                captures.setdefault(os.path.abspath(path), os.path.relpath(path, root))
+    return dict(sorted(captures.items()))
+
+
+def input_root(pattern: str) -> str:
+    """Directory part of a glob pattern or file path before its first wildcard."""
+    parts = os.path.dirname(pattern).split(os.sep)
+    for i, part in enumerate(parts):
+        if glob.has_magic(part):
+            parts = parts[:i]
+            break
+    return os.sep.join(parts) or os.curdir
+
+
+def report_file_for(capture_name: str, output_dir: str) -> str:
+    """
+    Path of the PDF report of a capture file.
+
+    :param capture_name: Path of the capture file relative to its input root.
+    """
+    name = os.path.splitext(capture_name)[0]
+    return os.path.join(output_dir, f"{name}.pdf")
+
+
+def process_capture(capture_file: str, report_file: str, attempt_number: int) -> tuple:
+    """
+    Load a capture file and render its report files in memory.
+    Runs in a worker process.
+
+    :return: Tuple of report file path and report files as returned by
+        render_report, or None if the capture is empty.
+    """
+    analyzer = AnalyzerController()
+    analyzer.real_capture = False
+    analyzer.data_path = capture_file
+    df = analyzer.capture_signals()
+    if df.empty:
+        return None
+
+    capture_date = time.strftime(
+        "%Y-%m-%d", time.localtime(os.path.getmtime(capture_file))
+    )
+    return render_report(df, report_file, attempt_number, capture_date)
+
+
+class BatchProgress:
+    """
+    Class to track finished captures of a batch job in the output directory,
+    so an interrupted job resumes where it stopped.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    def __init__(self, output_dir: str):
+        self.progress_file = os.path.join(output_dir, PROGRESS_FILE)
+        self.done: dict = {}
+        try:
+            with open(self.progress_file, "r", encoding="utf-8") as fp:
+                self.done = json.load(fp)
+        except (OSError, ValueError) as e:
+            self.logger.debug("Progress not loaded: %s", e)
+
+        self.logger.debug("Initialized %s", self.__class__.__name__)
+
+    def is_up_to_date(self, capture_file: str, report_file: str) -> bool:
+        """
+        Check if the report files of a capture exist and are newer than the
+        capture, or were made from the capture at its current mtime.
+        """
+        outputs = (
+            report_file,
+            report_file.replace(".pdf", ReportGenerator.OUTPUT_SUFFIXES["pulse_width"]),
+        )
+        if not all(os.path.exists(path) for path in outputs):
+            return False
+        capture_mtime = os.stat(capture_file).st_mtime_ns
+        if self.done.get(capture_file) == capture_mtime:
+            return True
+        return all(os.stat(path).st_mtime_ns >= capture_mtime for path in outputs)
+
+    def mark_done(self, capture_file: str) -> None:
+        """Record a finished capture and save progress."""
+        self.done[capture_file] = os.stat(capture_file).st_mtime_ns
+        tmp_file = self.progress_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as fp:
+            json.dump(self.done, fp)
+        os.replace(tmp_file, self.progress_file)
+
+
+def run_batch(
+    inputs: list,
+    output_dir: str,
+    workers: int,
+    force: bool,
+    archive: bool,
+    cache: bool = False,
+) -> int:
+    """
+    Render reports of capture files on a process pool.
+
+    :return: Number of captures that failed.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    progress = BatchProgress(output_dir)
+
+    jobs = []
+    failed = 0
+    captures = {}
+    for number, (capture_file, capture_name) in enumerate(
+        find_captures(inputs).items(), start=1
+    ):
+        report_file = report_file_for(capture_name, output_dir)
+        if report_file in captures:
+            # Reports of captures with the same name would overwrite each other
+            failed += 1
+            logger.error(
+                "Skipped %s: report %s is taken by %s",
+                capture_file,
+                report_file,
+                captures[report_file],
+            )
+            print(f"{capture_file} skipped: same report as {captures[report_file]}")
+            continue
+        captures[report_file] = capture_file
+        if not force and progress.is_up_to_date(capture_file, report_file):
+            logger.debug("Up to date: %s", capture_file)
+            continue
+        os.makedirs(os.path.dirname(report_file), exist_ok=True)
+        jobs.append((capture_file, report_file, number))
+
+    print(f"{len(jobs)} captures to process with {workers} workers")
+    # Reports are written by this process, one at a time
+    cfg.WRITE_BEHIND = False
+    cfg.ARCHIVE_CAPTURES = archive
+    cfg.CACHE_ENABLED = cache
+    writer = ReportWriter()
+
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("fork")
+    ) as executor:
+        futures = {
+            executor.submit(RunMetrics.call_in_worker, process_capture, *job): job[0]
+            for job in jobs
+        }
+        for count, future in enumerate(as_completed(futures), start=1):
+            capture_file = futures[future]
+            try:
+                result, records = future.result()
+                RunMetrics.save_records(records)
+                if result is None:
+                    raise ValueError("no samples loaded")
+                report_file, files = result
+                writer.write(report_file, files)
+                progress.mark_done(capture_file)
+                print(f"[{count}/{len(jobs)}] {capture_file} -> {report_file}")
+            except Exception as e:  # pylint: disable=broad-except
+                failed += 1
+                logger.error("Failed to process %s: %s", capture_file, e)
+                print(f"[{count}/{len(jobs)}] {capture_file} failed: {e}")
+    return failed
+
+
+def main() -> None:
+    """Parse command line arguments and run a batch job."""
+    parser = argparse.ArgumentParser(
+        description="Render analyzer-reporter reports of archived captures"
+    )
+    parser.add_argument(
+        "inputs",
+        nargs="+",
+        help="capture files (.csv, .sr, .npz, .bin), directories or glob patterns",
+    )
+    parser.add_argument(
+        "-o", "--output-dir", default="reports", help="directory for reports"
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=os.cpu_count(),
+        help="number of worker processes, all cores by default",
+    )
+    parser.add_argument(
+        "-f",
+        "--force",
+        action="store_true",
+        help="process captures even if their reports are up to date",
+    )
+    parser.add_argument(
+        "-a",
+        "--archive",
+        action="store_true",
+        help="also save captures as archives next to their reports",
+    )
+    parser.add_argument(
+        "-c",
+        "--cache",
+        action="store_true",
+        help="reuse results of captures processed before from the result cache",
+    )
+    args = parser.parse_args()
+
+    failed = run_batch(
+        args.inputs, args.output_dir, args.workers, args.force, args.archive, args.cache
+    )
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()
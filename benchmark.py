@@ -0,0 +1,426 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import io
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import tempfile
+import subprocess
+import tracemalloc
+from contextlib import contextmanager
+
+import numpy as np
+import matplotlib
+
+matplotlib.use("Agg")
+
+# pylint: disable=wrong-import-position
+
+from config import Configuration as cfg
+from analyzer_controller import AnalyzerController
+from capture_parser import CsvStreamParser
+from signal_edges import SignalEdges
+from signal_processor import SignalProcessor
+from signal_grapher import SignalGrapher
+from report_generator import ReportGenerator
+
+# Slowdown over the compared results reported as a regression
+REGRESSION_THRESHOLD = 1.2
+# Stages faster than this are too noisy to compare
+MIN_COMPARED_SECONDS = 0.01
+
+
+def synthetic_signals(
+    samples: int,
+    channels: int = 10,
+    pulse_density: float = 0.01,
+    glitch_rate: float = 0.0,
+    seed: int = 0,
+) -> np.ndarray:
+    """
+    Generate random logic signals.
+
+    :param samples: Number of samples per channel.
+    :param channels: Number of channels.
+    :param pulse_density: Probability of an edge at each sample.
+    :param glitch_rate: Probability of a single-sample glitch at each sample.
+    :param seed: Random generator seed.
+    :return: (samples, channels) int8 matrix of 0/1 levels.
+    """
+    rng = np.random.default_rng(seed)
+    matrix = np.empty((channels, samples), dtype=np.int8)
+    for i in range(channels):
+        levels = np.logical_xor.accumulate(rng.random(samples) < pulse_density)
+        if glitch_rate:
+            levels ^= rng.random(samples) < glitch_rate
+        matrix[i] = levels
+    return matrix.T
+
+
+def channel_names(channels: int) -> list:
+    """Channel labels for synthetic signals."""
+    return [f"CH{i}" for i in range(channels)]
+
+
+def write_capture_csv(path: str, matrix: np.ndarray, columns: list) -> None:
+    """Write signals in the sigrok-cli logic CSV format."""
+    text = np.full((matrix.shape[0], 2 * matrix.shape[1]), ord(","), dtype=np.uint8)
+    text[:, ::2] = matrix + ord("0")
+    text[:, -1] = ord("\n")
+    with open(path, "wb") as fp:
+        fp.write((",".join(columns) + "\n").encode("utf-8"))
+        fp.write(text.tobytes())
+
+
+@contextmanager
+def measure(result: dict, stage: str):
+    """
+    Time a stage and, while tracemalloc is tracing, record the peak of memory
+    allocated over the memory in use when the stage started.
+    """
+    tracing = tracemalloc.is_tracing()
+    if tracing:
+        in_use = tracemalloc.get_traced_memory()[0]
+        tracemalloc.reset_peak()
+    start = time.perf_counter()
+    yield
+    result[f"{stage}_s"] = time.perf_counter() - start
+    if tracing:
+        result[f"{stage}_peak_mb"] = (
+            tracemalloc.get_traced_memory()[1] - in_use
+        ) / 2**20
+
+
+def measure_figure(processor: SignalProcessor, vlines: list = None) -> dict:
+    """Plot processed signals and measure figure build, PDF save and size."""
+    grapher = SignalGrapher(
+        pulse_counts=processor.pulse_count,
+        pulse_points_width=processor.pulse_points_width,
+        rising_signals=processor.rising_signals,
+        filtered_edges=processor.filtered_edges,
+    )
+    grapher.add_vlines(vlines or [])
+
+    start = time.perf_counter()
+    grapher.plot_signals()
+    plot_s = time.perf_counter() - start
+
+    pdf = io.BytesIO()
+    start = time.perf_counter()
+    grapher.figure.savefig(pdf, format="pdf")
+    save_s = time.perf_counter() - start
+
+    artists = sum(len(ax.get_children()) for ax in grapher.figure.axes)
+    grapher.close()
+    return {
+        "plot_s": plot_s,
+        "save_s": save_s,
+        "pdf_bytes": pdf.tell(),
+        "artists": artists,
+        **{f"{name}_s": sec for name, sec in grapher.timings.items()},
+    }
+
+
+def report(samples: int, engine: str, result: dict) -> None:
+    """Print one benchmark result."""
+    print(
+        f"{samples:>10} {engine:>8} plot {result['plot_s']:8.3f} s"
+        f"  save {result['save_s']:8.3f} s  pdf {result['pdf_bytes'] / 1024:10.1f} KB"
+        f"  artists {result['artists']:>6}"
+    )
+
+
+def bench_render(
+    sizes: list, engines: list, channels: int, pulse_density: float, glitch_rate: float
+) -> list:
+    """
+    Compare plotting time, PDF save time and PDF size of render engines.
+    Pulse width annotations are disabled to measure signal traces only.
+    """
+    cfg.PLOT_WIDTH = None
+    results = []
+    for samples in sizes:
+        processor = SignalProcessor(
+            synthetic_signals(samples, channels, pulse_density, glitch_rate),
+            channel_names(channels),
+        )
+        for engine in engines:
+            cfg.RENDER_ENGINE = engine
+            result = measure_figure(processor)
+            results.append({"samples": samples, "engine": engine, **result})
+            report(samples, engine, result)
+    return results
+
+
+def bench_annotations(
+    sizes: list, engines: list, channels: int, pulse_density: float, glitch_rate: float
+) -> list:
+    """
+    Compare figure build time, PDF save time and PDF size of annotation
+    engines, with pulse widths of all channels and a vertical line every
+    tenth of the capture.
+    """
+    cfg.PLOT_WIDTH = "all"
+    results = []
+    for samples in sizes:
+        processor = SignalProcessor(
+            synthetic_signals(samples, channels, pulse_density, glitch_rate),
+            channel_names(channels),
+        )
+        vlines = list(range(0, samples, max(samples // 10, 1)))
+        for engine in engines:
+            cfg.ANNOTATION_ENGINE = engine
+            result = measure_figure(processor, vlines)
+            results.append({"samples": samples, "engine": engine, **result})
+            report(samples, engine, result)
+    return results
+
+
+def bench_pipeline(
+    sizes: list, engines: list, channels: int, pulse_density: float, glitch_rate: float
+) -> list:
+    """
+    Time every stage of the report pipeline with the configured settings and
+    each filter engine: loading a CSV capture file, streaming the same CSV
+    through the capture parser, edge extraction, noise filtering, pulse
+    extraction, pulse metrics, plotting, report composition and pulse width
+    CSV writing.
+    """
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        capture_file = os.path.join(tmp_dir, "capture.csv")
+        for samples in sizes:
+            columns = channel_names(channels)
+            write_capture_csv(
+                capture_file,
+                synthetic_signals(samples, channels, pulse_density, glitch_rate),
+                columns,
+            )
+            loaded = {}
+
+            analyzer = AnalyzerController()
+            analyzer.real_capture = False
+            analyzer.data_path = capture_file
+            with measure(loaded, "load"):
+                signals_df = analyzer.capture_signals()
+
+            parser = CsvStreamParser()
+            with measure(loaded, "stream"), open(capture_file, "rb") as fp:
+                while chunk := fp.read(cfg.CAPTURE_CHUNK_SIZE):
+                    parser.feed(chunk)
+                parser.finish()
+
+            for engine in engines:
+                cfg.FILTER_ENGINE = engine
+                result = dict(loaded)
+                # pylint: disable=protected-access
+                with measure(result, "edges"):
+                    signal_edges = SignalEdges.from_dataframe(signals_df)
+                with measure(result, "filter"):
+                    filtered_edges = SignalProcessor._filter_noise(
+                        signals_df, signal_edges
+                    )
+                with measure(result, "pulses"):
+                    pulse_table, rising = SignalProcessor._extract_pulses(
+                        filtered_edges
+                    )
+                with measure(result, "metrics"):
+                    processor = SignalProcessor.from_results(
+                        signals_df,
+                        filtered_edges,
+                        pulse_table,
+                        rising,
+                        SignalProcessor._count_glitches(signal_edges, filtered_edges),
+                    )
+
+                grapher = SignalGrapher(
+                    filtered_edges=processor.filtered_edges,
+                    pulse_counts=processor.pulse_count,
+                    pulse_points_width=processor.pulse_points_width,
+                    rising_signals=processor.rising_signals,
+                )
+                with measure(result, "plot"):
+                    grapher.plot_signals()
+
+                generator = ReportGenerator(
+                    figure=grapher.figure,
+                    report_file=os.path.join(tmp_dir, "report.pdf"),
+                    attempt_number=1,
+                    capture_date=time.strftime("%Y-%m-%d"),
+                )
+                with measure(result, "report"):
+                    report_pdf = generator.render_report()
+                grapher.close()
+
+                with measure(result, "csv"):
+                    generator.save_pulse_width_csv(processor.pulse_width)
+
+                result["pulses"] = len(pulse_table)
+                result["pdf_bytes"] = len(report_pdf)
+                results.append({"samples": samples, "engine": engine, **result})
+                print(
+                    f"{samples:>10} {engine:>8} "
+                    + "  ".join(
+                        f"{key[:-2]} {sec:.3f}"
+                        for key, sec in result.items()
+                        if key.endswith("_s")
+                    )
+                )
+    return results
+
+
+BENCHMARKS = {
+    "pipeline": (bench_pipeline, [cfg.FILTER_ENGINE]),
+    "render": (bench_render, ["samples", "edges", "minmax"]),
+    "annotations": (bench_annotations, ["artists", "batched"]),
+}
+
+
+def environment() -> dict:
+    """Describe the commit and platform the benchmarks run on."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=os.path.dirname(os.path.abspath(__file__)),
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+        "machine": platform.machine(),
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "matplotlib": matplotlib.__version__,
+    }
+
+
+def compare(results: dict, baseline_file: str, threshold: float) -> int:
+    """
+    Compare stage timings with the results of a previous run.
+
+    :return: Number of stages slower than threshold times the previous run.
+    """
+    with open(baseline_file, "r", encoding="utf-8") as fp:
+        baseline = json.load(fp)
+    print(f"compared with {baseline['environment'].get('commit')}:")
+
+    regressions = 0
+    for name, bench_results in results.items():
+        previous = {
+            (result["samples"], result["engine"]): result
+            for result in baseline["results"].get(name, [])
+        }
+        for result in bench_results:
+            base = previous.get((result["samples"], result["engine"]))
+            if base is None:
+                continue
+            for key, sec in result.items():
+                if not key.endswith("_s") or base.get(key, 0) < MIN_COMPARED_SECONDS:
+                    continue
+                ratio = sec / base[key]
+                if ratio > threshold:
+                    regressions += 1
+                    print(
+                        f"{name} {result['samples']:>10} {result['engine']:>8}"
+                        f" {key[:-2]} {base[key]:.3f} s -> {sec:.3f} s ({ratio:.2f}x)"
+                    )
+    print(f"{regressions} regressions over {threshold:.2f}x")
+    return regressions
+
+
+def main() -> None:
+    """Run benchmarks from the command line."""
+    parser = argparse.ArgumentParser(description="analyzer-reporter benchmarks")
+    parser.add_argument(
+        "--benchmarks",
+        nargs="+",
+        choices=list(BENCHMARKS),
+        help="benchmarks to run, all by default",
+    )
+    parser.add_argument(
+        "--sizes",
+        type=int,
+        nargs="+",
+        default=[4096, 100_000, 1_000_000, 10_000_000],
+        help="numbers of samples per channel",
+    )
+    parser.add_argument(
+        "--engines",
+        nargs="+",
+        help="engines to compare, all engines of a benchmark by default",
+    )
+    parser.add_argument("--channels", type=int, default=10)
+    parser.add_argument(
+        "--pulse-density",
+        type=float,
+        default=0.001,
+        help="probability of an edge at each sample",
+    )
+    parser.add_argument(
+        "--glitch-rate",
+        type=float,
+        default=0.0,
+        help="probability of a single-sample glitch at each sample",
+    )
+    parser.add_argument(
+        "--no-memory",
+        action="store_true",
+        help="do not trace peak memory of pipeline stages (tracing slows them)",
+    )
+    parser.add_argument("-o", "--output", help="save results to a JSON file")
+    parser.add_argument(
+        "--compare",
+        metavar="JSON",
+        help="report stages slower than in saved results and exit with 1",
+    )
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=REGRESSION_THRESHOLD,
+        help="slowdown reported as a regression",
+    )
+    args = parser.parse_args()
+
+    if not args.no_memory:
+        tracemalloc.start()
+
+    results = {}
+    for name in args.benchmarks or BENCHMARKS:
+        bench, engines = BENCHMARKS[name]
+        print(f"{name}:")
+        results[name] = bench(
+            args.sizes,
+            args.engines or engines,
+            args.channels,
+            args.pulse_density,
+            args.glitch_rate,
+        )
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as fp:
+            json.dump(
+                {"environment": environment(), "args": vars(args), "results": results},
+                fp,
+                indent=2,
+            )
+    if args.compare and compare(results, args.compare, args.threshold):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import io
+import json
+import struct
+import zipfile
+
+import numpy as np
+import pandas as pd
+
+from config import Configuration as cfg
+from logger import get_cls_logger
+from replay_source import ReplaySource
+
+# Size of the fixed part of a zip local file header
+_ZIP_LOCAL_HEADER_SIZE = 30
+
+
+class CaptureArchive:
+    """
+    Class to archive raw captures with their pulse tables.
+
+    The archive is an NPZ file with the samples bit-packed per channel
+    (one bit per sample), the pulse table and JSON metadata. Archives are
+    stored uncompressed by default, so that the packed samples can be
+    memory-mapped straight from the file when loading.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    VERSION = 1
+
+    def __init__(
+        self,
+        columns: list,
+        length: int,
+        packed: np.ndarray,
+        pulse_table: np.ndarray,
+        metadata: dict,
+    ):
+        """
+        Initialize CaptureArchive.
+
+        :param columns: Channel names.
+        :param length: Number of samples of each channel.
+        :param packed: (channels, ceil(length / 8)) bit-packed samples.
+        :param pulse_table: Pulse table of the capture.
+        :param metadata: Capture metadata (date, index, channel map, sample rate).
+        """
+        self.columns = list(columns)
+        self.length = length
+        self.packed = packed
+        self.pulse_table = pulse_table
+        self.metadata = metadata
+
+        self.logger.debug("Initialized %s", self.__class__.__name__)
+
+    @classmethod
+    def from_dataframe(
+        cls, signals_df: pd.DataFrame, pulse_table: np.ndarray, metadata: dict
+    ) -> "CaptureArchive":
+        """Bit-pack captured signals of a DataFrame."""
+        channels = np.ascontiguousarray(signals_df.to_numpy(dtype=np.int8).T)
+        return cls(
+            list(signals_df.columns),
+            len(signals_df),
+            np.packbits(channels, axis=1),
+            pulse_table,
+            metadata,
+        )
+
+    @classmethod
+    def from_replay_source(
+        cls, source: ReplaySource, pulse_table: np.ndarray, metadata: dict
+    ) -> "CaptureArchive":
+        """Bit-pack the signals of a replay source a chunk at a time."""
+        # Whole bytes per chunk, so chunks are packed independently
+        chunk_size = max(cfg.REPLAY_CHUNK_SIZE // 8, 1) * 8
+        packed = np.empty((len(source.columns), (len(source) + 7) // 8), dtype=np.uint8)
+        for start in range(0, len(source), chunk_size):
+            channels = source.decode(start, start + chunk_size).T
+            packed[:, start // 8 : start // 8 + (channels.shape[1] + 7) // 8] = (
+                np.packbits(channels, axis=1)
+            )
+        return cls(list(source.columns), len(source), packed, pulse_table, metadata)
+
+    def to_bytes(self) -> bytes:
+        """Save the archive to NPZ bytes, deflated with ARCHIVE_COMPRESS."""
+        savez = np.savez_compressed if cfg.ARCHIVE_COMPRESS else np.savez
+        archive = io.BytesIO()
+        savez(
+            archive,
+            packed=self.packed,
+            pulse_table=self.pulse_table,
+            metadata=np.array(
+                json.dumps(
+                    {
+                        "version": self.VERSION,
+                        "columns": self.columns,
+                        "length": self.length,
+                        **self.metadata,
+                    }
+                )
+            ),
+        )
+        return archive.getvalue()
+
+    def save(self, path: str) -> None:
+        """Save the archive to a file."""
+        with open(path, "wb") as fp:
+            fp.write(self.to_bytes())
+
+    @classmethod
+    def load(cls, path: str) -> "CaptureArchive":
+        """
+        Load an archive, memory-mapping the packed samples if the archive
+        is not compressed.
+        """
+        with zipfile.ZipFile(path) as archive:
+            metadata = json.loads(
+                str(np.load(io.BytesIO(archive.read("metadata.npy"))))
+            )
+            pulse_table = np.load(io.BytesIO(archive.read("pulse_table.npy")))
+            packed = cls._memmap_member(path, archive.getinfo("packed.npy"))
+            if packed is None:
+                packed = np.load(io.BytesIO(archive.read("packed.npy")))
+
+        if metadata.pop("version") > cls.VERSION:
+            raise ValueError(f"Unsupported capture archive version: {path}")
+        return cls(
+            metadata.pop("columns"),
+            metadata.pop("length"),
+            packed,
+            pulse_table,
+            metadata,
+        )
+
+    @staticmethod
+    def _memmap_member(path: str, info: zipfile.ZipInfo) -> np.ndarray:
+        """Memory-map an uncompressed array of an NPZ file, None if not possible."""
+        if info.compress_type != zipfile.ZIP_STORED:
+            return None
+        with open(path, "rb") as fp:
+            fp.seek(info.header_offset)
+            local_header = fp.read(_ZIP_LOCAL_HEADER_SIZE)
+            name_size, extra_size = struct.unpack("<HH", local_header[26:30])
+            fp.seek(name_size + extra_size, io.SEEK_CUR)
+
+            version = np.lib.format.read_magic(fp)
+            if version == (1, 0):
+                shape, fortran_order, dtype = np.lib.format.read_array_header_1_0(fp)
+            else:
+                shape, fortran_order, dtype = np.lib.format.read_array_header_2_0(fp)
+            offset = fp.tell()
+
+        if not np.prod(shape):
+            return None
+        return np.memmap(
+            path,
+            dtype=dtype,
+            mode="r",
+            offset=offset,
+            shape=shape,
+            order="F" if fortran_order else "C",
+        )
+
+    def channel(self, col: str) -> np.ndarray:
+        """Unpack the samples of one channel."""
+        packed = self.packed[self.columns.index(col)]
+        return np.unpackbits(packed, count=self.length).view(np.int8)
+
+    def to_matrix(self) -> np.ndarray:
+        """Unpack samples to a (samples, channels) int8 matrix."""
+        return np.unpackbits(self.packed, axis=1, count=self.length).view(np.int8).T
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Unpack samples to a DataFrame of signals."""
+        return pd.DataFrame(self.to_matrix(), columns=self.columns, copy=False)
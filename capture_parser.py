@@ -0,0 +1,266 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import re
+import zipfile
+import configparser
+
+import numpy as np
+import pandas as pd
+
+from logger import get_cls_logger
+
+# ASCII codes used by the sigrok-cli CSV output
+_NEWLINE = ord("\n")
+_ZERO = ord("0")
+_ONE = ord("1")
+_NINE = ord("9")
+
+# sigrok size string of a sample rate, e.g. "1000", "20k" or "1 MHz"
+_SAMPLE_RATE = re.compile(r"^\s*(\d+(?:\.\d+)?)\s*([kmg]?)(?:hz)?\s*$", re.IGNORECASE)
+_SAMPLE_RATE_PREFIXES = {"": 1, "k": 10**3, "m": 10**6, "g": 10**9}
+
+
+def unpack_bits(packed: np.ndarray, bits: list, out: np.ndarray) -> None:
+    """
+    Unpack channel bits of packed binary samples.
+
+    :param packed: (samples, unitsize) matrix of packed little-endian samples.
+    :param bits: Bit position of each channel in a packed sample.
+    :param out: (channels, samples) int8 matrix to unpack to.
+    """
+    for i, bit in enumerate(bits):
+        np.bitwise_and(
+            packed[:, bit // 8] >> (bit % 8), 1, out=out[i], casting="unsafe"
+        )
+
+
+class CsvStreamParser:
+    """
+    Incremental parser of sigrok-cli logic CSV output.
+
+    Chunks of the output are fed as they arrive from the pipe and decoded
+    straight into a preallocated int8 sample matrix, so no full text copy
+    of the capture is ever held in memory.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    DEFAULT_CAPACITY = 4096
+
+    def __init__(self, expected_samples: int = 0):
+        """
+        Initialize CsvStreamParser.
+
+        :param expected_samples: Number of samples to preallocate for, 0 if unknown.
+        """
+        self.columns: list = []
+        self.samples = 0
+        self._capacity = expected_samples or self.DEFAULT_CAPACITY
+        self._matrix = np.empty((0, 0), dtype=np.int8)
+        self._tail = b""
+
+        self.logger.debug("Initialized %s", self.__class__.__name__)
+
+    def feed(self, chunk: bytes) -> None:
+        """Parse all complete lines of the chunk and keep the incomplete rest."""
+        data = self._tail + chunk if self._tail else chunk
+        end = data.rfind(b"\n") + 1
+        self._tail = data[end:]
+        if end:
+            self._parse_lines(memoryview(data)[:end])
+
+    def finish(self) -> pd.DataFrame:
+        """Parse the remaining data and return the capture as a DataFrame."""
+        if self._tail.strip():
+            self._parse_lines(memoryview(self._tail + b"\n"))
+        self._tail = b""
+        return pd.DataFrame(
+            self._matrix[: self.samples], columns=self.columns, copy=False
+        )
+
+    def decoded(self, start: int) -> np.ndarray:
+        """Samples parsed from start on as a (samples, channels) matrix."""
+        return self._matrix[start : self.samples]
+
+    def _parse_lines(self, block: memoryview) -> None:
+        """Decode complete CSV lines into the sample matrix."""
+        raw = np.frombuffer(block, dtype=np.uint8)
+        if not self.columns:
+            # The first line holds channel labels (label=channel)
+            header_end = int(np.argmax(raw == _NEWLINE))
+            self.columns = bytes(block[:header_end]).decode("utf-8").strip().split(",")
+            self._matrix = np.empty((self._capacity, len(self.columns)), dtype=np.int8)
+            raw = raw[header_end + 1 :]
+
+        rows = np.count_nonzero(raw == _NEWLINE)
+        digits = raw[(raw >= _ZERO) & (raw <= _NINE)]
+
+        if digits.size != rows * len(self.columns) or np.any(digits > _ONE):
+            raise pd.errors.ParserError(
+                f"Unexpected logic CSV data after sample {self.samples}"
+            )
+
+        self._reserve(rows)
+        self._matrix[self.samples : self.samples + rows] = (digits - _ZERO).reshape(
+            rows, len(self.columns)
+        )
+        self.samples += rows
+
+    def _reserve(self, rows: int) -> None:
+        """Grow the sample matrix when the next rows do not fit."""
+        required = self.samples + rows
+        if required <= self._matrix.shape[0]:
+            return
+        capacity = max(required, 2 * self._matrix.shape[0])
+        matrix = np.empty((capacity, len(self.columns)), dtype=np.int8)
+        matrix[: self.samples] = self._matrix[: self.samples]
+        self._matrix = matrix
+        self.logger.debug("Sample matrix grown to %d rows", capacity)
+
+
+class BinaryStreamDecoder:
+    """
+    Incremental decoder of sigrok-cli binary logic output.
+
+    Each sample is a packed little-endian bitfield of ``unitsize`` bytes.
+    The requested channel bits are unpacked straight from a zero-copy
+    ``np.frombuffer`` view into a preallocated int8 sample matrix.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    DEFAULT_CAPACITY = 4096
+
+    def __init__(
+        self, columns: list, bits: list, unitsize: int, expected_samples: int = 0
+    ):
+        """
+        Initialize BinaryStreamDecoder.
+
+        :param columns: Channel labels of the decoded matrix.
+        :param bits: Bit position of each channel in a packed sample.
+        :param unitsize: Number of bytes per packed sample.
+        :param expected_samples: Number of samples to preallocate for, 0 if unknown.
+        """
+        self.columns = columns
+        self.bits = bits
+        self.unitsize = unitsize
+        self.samples = 0
+        # Channel-major storage keeps every column contiguous
+        self._matrix = np.empty(
+            (len(columns), expected_samples or self.DEFAULT_CAPACITY), dtype=np.int8
+        )
+        self._tail = b""
+
+        self.logger.debug("Initialized %s", self.__class__.__name__)
+
+    def feed(self, chunk: bytes) -> None:
+        """Decode all complete samples of the chunk and keep the incomplete rest."""
+        data = self._tail + chunk if self._tail else chunk
+        end = len(data) - len(data) % self.unitsize
+        self._tail = data[end:]
+        if end:
+            self._decode(memoryview(data)[:end])
+
+    def finish(self) -> pd.DataFrame:
+        """Return the capture as a DataFrame, dropping an incomplete last sample."""
+        if self._tail:
+            self.logger.warning("Dropped %d trailing bytes", len(self._tail))
+            self._tail = b""
+        return pd.DataFrame(
+            self._matrix[:, : self.samples].T, columns=self.columns, copy=False
+        )
+
+    def decoded(self, start: int) -> np.ndarray:
+        """Samples decoded from start on as a (samples, channels) matrix."""
+        return self._matrix[:, start : self.samples].T
+
+    def _decode(self, block: memoryview) -> None:
+        """Unpack channel bits of complete samples into the sample matrix."""
+        packed = np.frombuffer(block, dtype=np.uint8).reshape(-1, self.unitsize)
+        rows = packed.shape[0]
+        self._reserve(rows)
+        unpack_bits(
+            packed, self.bits, self._matrix[:, self.samples : self.samples + rows]
+        )
+        self.samples += rows
+
+    def _reserve(self, rows: int) -> None:
+        """Grow the sample matrix when the next rows do not fit."""
+        required = self.samples + rows
+        if required <= self._matrix.shape[1]:
+            return
+        capacity = max(required, 2 * self._matrix.shape[1])
+        matrix = np.empty((len(self.columns), capacity), dtype=np.int8)
+        matrix[:, : self.samples] = self._matrix[:, : self.samples]
+        self._matrix = matrix
+        self.logger.debug("Sample matrix grown to %d rows", capacity)
+
+
+def command_sample_rate(command: list) -> str:
+    """Get the sample rate configured in a sigrok-cli command, None if unset."""
+    for i, arg in enumerate(command[:-1]):
+        if arg == "--config":
+            for option in command[i + 1].split(":"):
+                if option.startswith("samplerate="):
+                    return option.split("=")[1]
+    return None
+
+
+def parse_sample_rate(rate: str) -> float:
+    """
+    Convert a sigrok sample rate, e.g. "1000", "20k" or "1 MHz", to Hz.
+
+    :raises ValueError: If the sample rate is not a sigrok size string.
+    """
+    match = _SAMPLE_RATE.match(rate)
+    if match is None:
+        raise ValueError(f"Invalid sample rate: {rate}")
+    return float(match.group(1)) * _SAMPLE_RATE_PREFIXES[match.group(2).lower()]
+
+
+def read_session_file(path: str) -> pd.DataFrame:
+    """
+    Load logic samples from a sigrok .sr session file.
+
+    The session is a zip archive with a ``metadata`` ini file describing the
+    probes and unitsize, and the packed samples split into ``logic-1-N`` files.
+    """
+    with zipfile.ZipFile(path) as session:
+        metadata = configparser.ConfigParser()
+        metadata.read_string(session.read("metadata").decode("utf-8"))
+        device = metadata["device 1"]
+
+        probes = sorted(
+            (int(key[len("probe") :]), name)
+            for key, name in device.items()
+            if key.startswith("probe")
+        )
+        capture_file = device.get("capturefile", "logic-1")
+        chunks = sorted(
+            (name for name in session.namelist() if name.startswith(capture_file)),
+            key=lambda name: (
+                int(name.rsplit("-", 1)[-1]) if name != capture_file else 0
+            ),
+        )
+
+        unitsize = device.getint("unitsize", 1)
+        decoder = BinaryStreamDecoder(
+            columns=[name for _, name in probes],
+            bits=[num - 1 for num, _ in probes],
+            unitsize=unitsize,
+            expected_samples=sum(session.getinfo(name).file_size for name in chunks)
+            // unitsize,
+        )
+        for name in chunks:
+            decoder.feed(session.read(name))
+
+    return decoder.finish()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import re
+
+import numpy as np
+import pandas as pd
+
+from config import Configuration as cfg
+from logger import get_cls_logger
+from signal_processor import SignalProcessor
+
+
+class ChannelTiming:
+    """
+    Class to analyze timing between pulses of channel pairs.
+
+    Pulses of the first channel of a pair are expected to lead, each one
+    followed by a pulse of the second channel before its next pulse. Edge
+    lists of both channels are merged in one sorted pass, so the analysis
+    takes time linear in the number of edges, not samples.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    # Leading and following channel labels of the capture command
+    PAIR_PATTERN = re.compile(r"^(AS\d+)_2$")
+
+    def __init__(self, pulse_points_width: dict, pairs: list = None):
+        """
+        Initialize ChannelTiming.
+
+        :param pulse_points_width: Dictionary of pulse points and widths for each signal.
+        :param pairs: (leading, following) channel pairs, TIMING_PAIRS or
+            the AS*_2 / AS*_4 pairs of the captured channels by default.
+        """
+        self.pulse_points_width = pulse_points_width
+        self.pairs = self._get_pairs(cfg.TIMING_PAIRS if pairs is None else pairs)
+        # Pulse points are in samples, delays and overlaps are given in ms
+        self.ms_per_sample = SignalProcessor.ms_per_sample()
+        self.timing = self._analyze_pairs()
+
+        self.logger.debug("Initialized %s", self.__class__.__name__)
+
+    def _get_pairs(self, pairs: list) -> list:
+        """Get channel pairs to analyze, skipping channels not captured."""
+        if pairs is None:
+            pairs = [
+                (col, f"{match.group(1)}_4")
+                for col in self.pulse_points_width
+                if (match := self.PAIR_PATTERN.match(col))
+            ]
+        found = []
+        for leading, following in pairs:
+            if (
+                leading in self.pulse_points_width
+                and following in self.pulse_points_width
+            ):
+                found.append((leading, following))
+            else:
+                self.logger.warning(
+                    "Channel pair %s / %s not captured, skipped", leading, following
+                )
+        return found
+
+    def _analyze_pairs(self) -> pd.DataFrame:
+        """
+        Analyze all channel pairs.
+
+        :return: DataFrame indexed by pair: number of matched pulses, min,
+            max and mean delay in ms from the start of a leading pulse to the
+            start of its following pulse, number and total time in ms of the
+            windows where pulses of both channels overlap, and the number of
+            ordering violations: pulses started out of the alternating
+            leading, following order. Times are converted from samples at
+            the sample rate of CAPTURE_COMMAND.
+        """
+        rows = [self._analyze_pair(*pair) for pair in self.pairs]
+        return pd.DataFrame(
+            rows,
+            columns=[
+                "matched",
+                "delay_min",
+                "delay_max",
+                "delay_mean",
+                "overlaps",
+                "overlap_time",
+                "violations",
+            ],
+            index=pd.Index(
+                [f"{leading} / {following}" for leading, following in self.pairs],
+                name="pair",
+            ),
+        )
+
+    def _analyze_pair(self, leading: str, following: str) -> list:
+        """Analyze timing of a channel pair by merging its pulse edges."""
+        lead = np.asarray(self.pulse_points_width[leading]).reshape(-1, 3)
+        follow = np.asarray(self.pulse_points_width[following]).reshape(-1, 3)
+
+        # Pulse starts of both channels in time order, leading ones first on ties
+        order = self._merge_order(lead[:, 0], follow[:, 0])
+        starts = np.concatenate((lead[:, 0], follow[:, 0]))[order]
+        is_follow = order >= len(lead)
+
+        # A leading start directly followed by a following start is a match
+        matched = ~is_follow[:-1] & is_follow[1:]
+        delays = (starts[1:] - starts[:-1])[matched] * self.ms_per_sample
+        # Starts should alternate, beginning with a leading one
+        violations = np.count_nonzero(is_follow[1:] == is_follow[:-1]) + int(
+            len(is_follow) > 0 and is_follow[0]
+        )
+
+        overlap_count, overlap_time = self._overlaps(lead, follow)
+        if len(delays):
+            delay_stats = [delays.min(), delays.max(), delays.mean()]
+        else:
+            delay_stats = [np.nan] * 3
+        return [
+            len(delays),
+            *delay_stats,
+            overlap_count,
+            overlap_time * self.ms_per_sample,
+            violations,
+        ]
+
+    @classmethod
+    def _overlaps(cls, lead: np.ndarray, follow: np.ndarray) -> tuple:
+        """
+        Count windows where pulses of both channels are on, and their total
+        time in samples. Pulse edges of a channel are already sorted, as its
+        pulses do not overlap, so both edge lists are merged in one pass.
+        """
+        lead_edges = lead[:, :2].ravel()
+        follow_edges = follow[:, :2].ravel()
+        order = cls._merge_order(lead_edges, follow_edges)
+        edges = np.concatenate((lead_edges, follow_edges))[order]
+        # Pulse starts turn a channel on, pulse ends turn it off
+        steps = np.tile(np.array([1, -1]), len(lead) + len(follow))[order]
+
+        both_on = np.cumsum(steps)[:-1] == 2
+        widths = (edges[1:] - edges[:-1])[both_on]
+        widths = widths[widths > 0]
+        return len(widths), int(widths.sum())
+
+    @staticmethod
+    def _merge_order(first: np.ndarray, second: np.ndarray) -> np.ndarray:
+        """
+        Order merging two sorted arrays, elements of the first array first on
+        ties. A stable sort of two sorted runs is a single linear merge.
+        """
+        return np.argsort(np.concatenate((first, second)), kind="stable")
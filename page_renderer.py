@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import io
+from typing import NamedTuple
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from pypdf import PdfReader, PdfWriter
+
+from config import Configuration as cfg
+from logger import get_cls_logger
+from run_metrics import RunMetrics
+from signal_edges import SignalEdges
+from signal_grapher import SignalGrapher
+from report_generator import ReportGenerator
+
+
+class ReportPage(NamedTuple):
+    """Signals and pulses of one report page."""
+
+    start: int
+    edges: SignalEdges
+    pulse_points_width: dict
+    rising_signals: dict
+
+
+def render_page(page: ReportPage) -> bytes:
+    """
+    Plot a report page and save the figure to PDF.
+    Runs in a worker process of the page renderer.
+    """
+    grapher = SignalGrapher(
+        filtered_edges=page.edges,
+        pulse_counts={col: len(val) for col, val in page.pulse_points_width.items()},
+        pulse_points_width=page.pulse_points_width,
+        rising_signals=page.rising_signals,
+        x_offset=page.start,
+    )
+    grapher.plot_signals()
+    figure_pdf = ReportGenerator.figure_to_pdf(grapher.figure)
+    grapher.close()
+    return figure_pdf
+
+
+class PageRenderer:
+    """
+    Class to render paginated report figures on a process pool.
+
+    The capture is split into windows of PAGE_SAMPLES samples and every
+    window into groups of PAGE_CHANNELS channels. Each page is plotted by
+    a worker process on its own, and the page figures are joined into one
+    PDF, a page per report page. Pulses are annotated on every page they
+    cross, their arrows cut at the page edges and labelled with the full
+    pulse width.
+
+    Pages are rendered on the process pool forked at service start, see
+    Preloader.fork_workers(). Without it, e.g. in pipeline and batch worker
+    processes, they are rendered one by one in the calling process.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    # Page rendering process pool forked at start, None to render in place
+    executor: ProcessPoolExecutor = None
+
+    @classmethod
+    def pages(
+        cls, filtered_edges: SignalEdges, pulse_points_width: dict, rising_signals: dict
+    ) -> list:
+        """Split processed signals into report pages, time windows first."""
+        columns = filtered_edges.columns
+        page_samples = cfg.PAGE_SAMPLES or filtered_edges.length
+        page_channels = cfg.PAGE_CHANNELS or len(columns)
+
+        pages = []
+        for start in range(0, max(filtered_edges.length, 1), page_samples):
+            stop = min(start + page_samples, filtered_edges.length)
+            for first in range(0, len(columns), page_channels):
+                group = columns[first : first + page_channels]
+                page_pulses = {}
+                for col in group:
+                    points_width = np.asarray(pulse_points_width[col]).reshape(-1, 3)
+                    x1, x2 = points_width[:, 0], points_width[:, 1]
+                    page_points = points_width[(x1 < stop - 1) & (x2 > start)]
+                    # Arrows end at the page edges, widths stay whole
+                    page_points[:, :2] = page_points[:, :2].clip(start, stop - 1)
+                    page_pulses[col] = page_points
+                pages.append(
+                    ReportPage(
+                        start,
+                        filtered_edges.window(start, stop, group),
+                        page_pulses,
+                        {col: rising_signals[col] for col in group},
+                    )
+                )
+        return pages
+
+    @classmethod
+    def render(
+        cls, filtered_edges: SignalEdges, pulse_points_width: dict, rising_signals: dict
+    ) -> bytes:
+        """
+        Render the figures of all report pages.
+
+        :return: PDF of the page figures, one page per report page.
+        """
+        pages = cls.pages(filtered_edges, pulse_points_width, rising_signals)
+        with RunMetrics.stage("pages"):
+            if len(pages) > 1 and cls.executor is not None:
+                page_pdfs = list(cls.executor.map(render_page, pages))
+            else:
+                page_pdfs = [render_page(page) for page in pages]
+
+        writer = PdfWriter()
+        for page_pdf in page_pdfs:
+            writer.append_pages_from_reader(PdfReader(io.BytesIO(page_pdf)))
+        figure_pdf = io.BytesIO()
+        writer.write(figure_pdf)
+        cls.logger.debug("Rendered %d report pages", len(pages))
+        return figure_pdf.getvalue()
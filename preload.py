@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import io
+import time
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from config import Configuration as cfg
+from logger import get_cls_logger
+
+
+class Preloader:
+    """
+    Class to import and warm up heavy modules in the background.
+
+    The service gets ready for a button press without waiting for pandas,
+    scipy, matplotlib, reportlab and pypdf. They are imported and
+    initialized in a thread meanwhile, and the PDF template is cached,
+    so the first report runs as fast as the following ones.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    MODULES = (
+        "analyzer_controller",
+        "signal_processor",
+        "signal_grapher",
+        "report_generator",
+        "report_pipeline",
+    )
+
+    def __init__(self):
+        self.timings: dict = {}
+        self.thread = threading.Thread(target=self._preload, daemon=True)
+        self._done = False
+
+        self.logger.debug("Initialized %s", self.__class__.__name__)
+
+    @classmethod
+    def fork_workers(cls, workers: int) -> ProcessPoolExecutor:
+        """
+        Fork a pool of worker processes, each preloading the heavy modules
+        on its own in the background. Called at start, before any thread is
+        started: a forked child gets copies of the locks other threads may
+        hold, but not the threads that would release them.
+
+        :param workers: Number of worker processes.
+        """
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            mp_context=multiprocessing.get_context("fork"),
+            initializer=cls._preload_worker,
+        )
+        # All workers are forked when the first task is submitted, before the
+        # executor starts its own threads. Not waiting for the task, so the
+        # workers preload while the main process starts up
+        executor.submit(int)
+        cls.logger.debug("Forked %d worker processes", workers)
+        return executor
+
+    @classmethod
+    def _preload_worker(cls) -> None:
+        """Preload heavy modules in a worker process."""
+        cls().wait()
+
+    def start(self) -> None:
+        """Start preloading in the background."""
+        self.thread.start()
+
+    def wait(self) -> dict:
+        """
+        Wait until preloading is finished, preloading in the calling thread
+        if it was not started.
+
+        :return: Preloading timings in seconds.
+        """
+        if self.thread.is_alive():
+            self.thread.join()
+        elif not self._done:
+            self._preload()
+        return self.timings
+
+    def _preload(self) -> None:
+        """Import modules and warm up their first-use initialization."""
+        for name in self.MODULES:
+            self._timed(name, importlib.import_module, name)
+        self._timed("matplotlib warm-up", self._warm_up_matplotlib)
+        self._timed("reportlab warm-up", self._warm_up_reportlab)
+        self._timed("template", self._warm_up_template)
+        self._done = True
+
+        self.logger.info(
+            "Preloading finished in %.2f s: %s",
+            sum(self.timings.values()),
+            ", ".join(f"{name} {sec:.2f} s" for name, sec in self.timings.items()),
+        )
+
+    def _timed(self, name: str, func: callable, *args) -> None:
+        """Run a preloading step and record its duration."""
+        start = time.perf_counter()
+        func(*args)
+        self.timings[name] = time.perf_counter() - start
+
+    @staticmethod
+    def _warm_up_matplotlib() -> None:
+        """Build font caches and PDF backend state with a throwaway figure."""
+        # pylint: disable=import-outside-toplevel
+        from matplotlib.figure import Figure
+
+        fig = Figure()
+        ax = fig.add_subplot()
+        ax.step([0, 1], [0, 1])
+        ax.text(0.5, 0.5, cfg.TIME_UNITS)
+        fig.savefig(io.BytesIO(), format="pdf")
+
+    @staticmethod
+    def _warm_up_reportlab() -> None:
+        """Load reportlab fonts with a throwaway canvas."""
+        # pylint: disable=import-outside-toplevel
+        from reportlab.pdfgen import canvas
+
+        c = canvas.Canvas(io.BytesIO())
+        c.drawString(0, 0, cfg.CURRENT_DATE)
+        c.save()
+
+    @staticmethod
+    def _warm_up_template() -> None:
+        """Read the PDF template into the report generator cache."""
+        # pylint: disable=import-outside-toplevel
+        from report_generator import ReportGenerator
+
+        ReportGenerator.cache_template()
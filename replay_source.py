@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+from typing import Iterator, NamedTuple
+
+import numpy as np
+import pandas as pd
+
+from logger import get_cls_logger
+from capture_parser import unpack_bits
+
+
+class SignalWindow(NamedTuple):
+    """Samples from offset covering the start to stop samples with margins."""
+
+    start: int
+    stop: int
+    offset: int
+    samples: np.ndarray
+
+
+class ReplaySource:
+    """
+    Class to replay a sigrok-cli binary capture file memory-mapped.
+
+    The file holds packed little-endian samples of ``unitsize`` bytes, as
+    written by ``sigrok-cli --output-format binary``. Only the samples of
+    the requested range are decoded, so files larger than RAM can be
+    processed window by window.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    def __init__(self, path: str, columns: list, bits: list, unitsize: int):
+        """
+        Initialize ReplaySource.
+
+        :param path: Binary capture file.
+        :param columns: Channel labels.
+        :param bits: Bit position of each channel in a packed sample.
+        :param unitsize: Number of bytes per packed sample.
+        """
+        self.path = path
+        self.columns = columns
+        self.bits = bits
+        self.unitsize = unitsize
+        raw = np.memmap(path, dtype=np.uint8, mode="r")
+        self.packed = raw[: len(raw) - len(raw) % unitsize].reshape(-1, unitsize)
+
+        self.logger.debug("Initialized %s", self.__class__.__name__)
+
+    def __len__(self) -> int:
+        return self.packed.shape[0]
+
+    def __reduce__(self) -> tuple:
+        # Sent to worker processes by path, they map the file again
+        return (self.__class__, (self.path, self.columns, self.bits, self.unitsize))
+
+    @property
+    def empty(self) -> bool:
+        """True if the file holds no samples, like DataFrame.empty."""
+        return len(self) == 0
+
+    def decode(self, start: int, stop: int) -> np.ndarray:
+        """Decode samples from start to stop to a (samples, channels) int8 matrix."""
+        packed = self.packed[start:stop]
+        samples = np.empty((len(self.columns), packed.shape[0]), dtype=np.int8)
+        unpack_bits(packed, self.bits, samples)
+        return samples.T
+
+    def windows(self, chunk_size: int, overlap: int) -> Iterator[SignalWindow]:
+        """
+        Iterate over chunks of chunk_size samples decoded with overlap more
+        samples on both sides, where available.
+        """
+        for start in range(0, max(len(self), 1), chunk_size):
+            stop = min(start + chunk_size, len(self))
+            offset = max(start - overlap, 0)
+            yield SignalWindow(
+                start, stop, offset, self.decode(offset, min(stop + overlap, len(self)))
+            )
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Decode all samples to a DataFrame of signals."""
+        return pd.DataFrame(self.decode(0, len(self)), columns=self.columns, copy=False)
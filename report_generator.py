@@ -22,6 +22,7 @@ from pypdf import PdfReader, PdfWriter
 
 from config import Configuration as cfg
 from logger import get_cls_logger
+from run_metrics import RunMetrics
 
 
 class ReportGenerator:
@@ -29,93 +30,262 @@ class ReportGenerator:
 
     logger = get_cls_logger(__qualname__)
 
+    # Parsed PDF templates by path, read once per process
+    _template_cache: dict = {}
+
+    # Pulse statistics table columns: header and value format. Times and
+    # frequencies keep significant digits, whatever the sample rate
+    PULSE_STATS_COLUMNS = {
+        "pulses": ("Pulses", "{:.0f}"),
+        "period": ("Period, ms", "{:.4g}"),
+        "frequency": ("Freq, Hz", "{:.4g}"),
+        "duty_cycle": ("Duty", "{:.1%}"),
+        "width_min": ("Min, ms", "{:.4g}"),
+        "width_max": ("Max, ms", "{:.4g}"),
+        "width_mean": ("Mean, ms", "{:.4g}"),
+        "width_std": ("Std, ms", "{:.4g}"),
+        "glitches": ("Glitches", "{:.0f}"),
+    }
+
+    # Channel timing table columns: header and value format
+    CHANNEL_TIMING_COLUMNS = {
+        "matched": ("Matched", "{:.0f}"),
+        "delay_min": ("Min delay, ms", "{:.4g}"),
+        "delay_max": ("Max delay, ms", "{:.4g}"),
+        "delay_mean": ("Mean delay, ms", "{:.4g}"),
+        "overlaps": ("Overlaps", "{:.0f}"),
+        "overlap_time": ("Overlap, ms", "{:.4g}"),
+        "violations": ("Violations", "{:.0f}"),
+    }
+
+    # Suffixes of the files saved next to a report, by output
+    OUTPUT_SUFFIXES = {
+        "pulse_width": "-pulse-width.csv",
+        "pulse_stats": "-pulse-stats.csv",
+        "channel_timing": "-channel-timing.csv",
+        "capture_archive": "-capture.npz",
+    }
+
     def __init__(
         self,
         figure: pltfg.Figure,
         report_file: str,
         attempt_number: int,
         capture_date: str,
+        figure_pdf: bytes = None,
     ):
-        """Initialize ReportGenerator."""
+        """
+        Initialize ReportGenerator.
+
+        :param figure_pdf: Figure already saved to PDF, used instead of figure.
+            Each page of it is put on a page of the report.
+        """
         self.figure = figure
+        self.figure_pdf = figure_pdf
         self.report_file = report_file
         self.attempt_number = str(attempt_number).zfill(3)
         self.capture_date = capture_date
-        self.template = self._load_template()
+        self.annotations: list = []
+        # Tables drawn on a page of their own, as rows of cells
+        self.tables: list = []
 
         self.add_text(self.attempt_number, cfg.ATTEMPT_POINT)
         self.add_text(self.capture_date, cfg.DATE_POINT)
 
         self.logger.debug("Initialized %s", self.__class__.__name__)
 
-    def _load_template(self) -> io.BytesIO:
-        """Load PDF template."""
+    @classmethod
+    def cache_template(cls) -> PdfReader:
+        """Parse PDF template once and keep it in memory for next reports."""
+        if cfg.TEMPLATE_FILE not in cls._template_cache:
+            cls._template_cache[cfg.TEMPLATE_FILE] = PdfReader(cls._read_template())
+        return cls._template_cache[cfg.TEMPLATE_FILE]
+
+    @classmethod
+    def _read_template(cls) -> io.BytesIO:
+        """Read PDF template file or create a blank A4 page instead."""
         template = io.BytesIO()
         try:
             with open(cfg.TEMPLATE_FILE, "rb") as f:
                 template.write(f.read())
-            self.logger.debug("Template loaded from %s", cfg.TEMPLATE_FILE)
+            cls.logger.debug("Template loaded from %s", cfg.TEMPLATE_FILE)
         except FileNotFoundError:
             c = canvas.Canvas(template, pagesize=A4)
             c.showPage()
             c.save()
-            self.logger.warning(
+            cls.logger.warning(
                 "Template file %s not found, using blank A4 canvas", cfg.TEMPLATE_FILE
             )
         template.seek(0)
         return template
 
-    def add_text(self, text: str, point: tuple) -> None:
-        """Add text to the template."""
-        text_pdf = self._create_text_pdf(text, point)
-        text_page = PdfReader(text_pdf).pages[0]
+    def add_text(self, text: str, point: tuple, font_size: int = 12) -> None:
+        """Add text to the template. All texts are drawn on one overlay."""
+        self.annotations.append((text, point, font_size))
 
-        pdf_reader = PdfReader(self.template)
-        template_page = pdf_reader.pages[0]
+    def add_table(self, table: pd.DataFrame, columns: dict, index_header: str) -> None:
+        """
+        Add a table, e.g. pulse statistics. All tables are drawn one under
+        another on a page of their own after the figure pages.
 
-        template_page.merge_page(page2=text_page)
+        :param columns: Headers and value formats by table column.
+        :param index_header: Header of the table index column.
+        """
+        rows = [[index_header] + [header for header, _ in columns.values()]]
+        for label, values in table.iterrows():
+            rows.append(
+                [str(label)]
+                + [
+                    "-" if np.isnan(values[key]) else value_format.format(values[key])
+                    for key, (_, value_format) in columns.items()
+                ]
+            )
+        self.tables.append(rows)
 
-        writer = PdfWriter()
-        writer.append_pages_from_reader(pdf_reader)
-        writer.write(self.template)
+    def _create_tables_pdf(self) -> io.BytesIO:
+        """Create PDF with all tables, columns spread over the page width."""
+        tables_pdf = io.BytesIO()
+        c = canvas.Canvas(tables_pdf, pagesize=A4)
+        c.setFont("Helvetica", cfg.TABLE_FONT_SIZE)
+        x, y = cfg.TABLE_POINT
+        row_height = cfg.TABLE_FONT_SIZE * 1.8
+        for rows in self.tables:
+            column_width = (A4[0] - 2 * x) / len(rows[0])
+            for row in rows:
+                for i, cell in enumerate(row):
+                    c.drawString(x + i * column_width, y, cell)
+                y -= row_height
+            y -= row_height
+        c.save()
+        tables_pdf.seek(0)
+        return tables_pdf
 
-    def _create_text_pdf(self, text: str, point: tuple) -> io.BytesIO:
-        """Create PDF with text."""
+    def _create_text_pdf(self, page_number: str = None) -> io.BytesIO:
+        """Create PDF with all text annotations and the page number, if any."""
+        annotations = self.annotations
+        if page_number:
+            annotations = annotations + [(page_number, cfg.PAGE_NUMBER_POINT, 12)]
         text_pdf = io.BytesIO()
         c = canvas.Canvas(text_pdf, pagesize=A4)
-        c.drawString(point[0], point[1], text)
+        for text, point, font_size in annotations:
+            c.setFont("Helvetica", font_size)
+            c.drawString(point[0], point[1], text)
         c.save()
         text_pdf.seek(0)
         return text_pdf
 
     def generate_report(self) -> None:
         """Generate PDF report."""
-        figure_pdf = self._save_figure_to_pdf()
-        figure_page = PdfReader(figure_pdf).pages[0]
-
-        pdf_reader = PdfReader(self.template)
-        template_page = pdf_reader.pages[0]
+        with open(self.report_file, "wb") as fp:
+            fp.write(self.render_report())
 
-        template_page.merge_page(page2=figure_page)
+    def render_report(self) -> bytes:
+        """
+        Render PDF report in memory. Text and figure overlays are merged onto
+        a copy of the cached template page and the result is written once.
+        A figure of several pages, e.g. from the page renderer, makes a
+        report page each, followed by the page of tables, if added. Pages
+        are numbered when there is more than one.
+        """
+        template_page = self.cache_template().pages[0]
+        figure_pages = list(PdfReader(self._save_figure_to_pdf()).pages)
+        if self.tables:
+            figure_pages.append(PdfReader(self._create_tables_pdf()).pages[0])
 
         writer = PdfWriter()
-        writer.append_pages_from_reader(pdf_reader)
+        for number, figure_page in enumerate(figure_pages, 1):
+            # A blank page per report page, appended template pages are shared
+            report_page = writer.add_blank_page(
+                width=template_page.mediabox.width, height=template_page.mediabox.height
+            )
+            report_page.merge_page(page2=template_page)
+            page_number = (
+                f"{number} / {len(figure_pages)}" if len(figure_pages) > 1 else None
+            )
+            report_page.merge_page(
+                page2=PdfReader(self._create_text_pdf(page_number)).pages[0]
+            )
+            report_page.merge_page(page2=figure_page)
+            # Merged content is left uncompressed, several times the overlays
+            report_page.compress_content_streams()
 
-        with open(self.report_file, "wb") as fp:
-            writer.write(fp)
+        report_pdf = io.BytesIO()
+        writer.write(report_pdf)
+        return report_pdf.getvalue()
 
     def _save_figure_to_pdf(self) -> io.BytesIO:
-        """Save figure to PDF."""
-        figure_pdf = io.BytesIO()
-        with PdfPages(figure_pdf) as pdf:
-            pdf.savefig(self.figure)
-        figure_pdf.seek(0)
-        return figure_pdf
+        """Save figure to PDF, once, keeping the bytes in figure_pdf."""
+        if self.figure_pdf is None:
+            with RunMetrics.stage("figure pdf"):
+                self.figure_pdf = self.figure_to_pdf(self.figure)
+        return io.BytesIO(self.figure_pdf)
+
+    @classmethod
+    def figure_to_pdf(cls, figure: pltfg.Figure) -> bytes:
+        """
+        Save figure to PDF. With RASTER_TRACES, rasterized traces are saved
+        at RASTER_DPI, lowered down to RASTER_MIN_DPI while the PDF exceeds
+        FIGURE_PDF_BUDGET bytes.
+        """
+        dpi = cfg.RASTER_DPI if cfg.RASTER_TRACES else None
+        while True:
+            figure_pdf = io.BytesIO()
+            with PdfPages(figure_pdf) as pdf:
+                pdf.savefig(figure, dpi=dpi)
+            size = figure_pdf.getbuffer().nbytes
+            if dpi is None or not cfg.FIGURE_PDF_BUDGET:
+                break
+            if size <= cfg.FIGURE_PDF_BUDGET or dpi <= cfg.RASTER_MIN_DPI:
+                if size > cfg.FIGURE_PDF_BUDGET:
+                    cls.logger.warning(
+                        "Figure PDF of %d bytes exceeds the budget at %d dpi",
+                        size,
+                        dpi,
+                    )
+                break
+            # Image bytes shrink about with the square of the resolution
+            dpi = max(
+                cfg.RASTER_MIN_DPI,
+                int(dpi * min(0.9 * (cfg.FIGURE_PDF_BUDGET / size) ** 0.5, 0.8)),
+            )
+            cls.logger.debug("Figure PDF of %d bytes, saving at %d dpi", size, dpi)
+        return figure_pdf.getvalue()
+
+    def output_file(self, output: str) -> str:
+        """Path of an output file next to the report."""
+        return self.report_file.replace(".pdf", self.OUTPUT_SUFFIXES[output])
+
+    @property
+    def pulse_width_csv_file(self) -> str:
+        """Path of the pulse width CSV file next to the report."""
+        return self.output_file("pulse_width")
+
+    @property
+    def pulse_stats_csv_file(self) -> str:
+        """Path of the pulse statistics CSV file next to the report."""
+        return self.output_file("pulse_stats")
+
+    @property
+    def channel_timing_csv_file(self) -> str:
+        """Path of the channel timing CSV file next to the report."""
+        return self.output_file("channel_timing")
+
+    @property
+    def capture_archive_file(self) -> str:
+        """Path of the capture archive next to the report."""
+        return self.output_file("capture_archive")
+
+    def render_table_csv(self, table: pd.DataFrame) -> str:
+        """Render a table, e.g. pulse statistics, as CSV text."""
+        return table.to_csv()
 
     def save_pulse_width_csv(self, pulse_width: dict) -> None:
         """Save pulse width data to CSV."""
-        csv_file = self.report_file.replace(".pdf", "-pulse-width.csv")
+        with open(self.pulse_width_csv_file, "w", encoding="utf-8") as fp:
+            fp.write(self.render_pulse_width_csv(pulse_width))
 
+    def render_pulse_width_csv(self, pulse_width: dict) -> str:
+        """Render pulse width data in ms as CSV text."""
         # Check if all lists in the dictionary have the same size
         max_size = max(len(val) for val in pulse_width.values())
 
@@ -124,4 +294,4 @@ class ReportGenerator:
                 # Pad shorter lists with NaNs
                 val.extend([np.nan] * (max_size - len(val)))
             pulse_width[key] = val
-        pd.DataFrame(pulse_width).to_csv(csv_file)
+        return pd.DataFrame(pulse_width).to_csv()
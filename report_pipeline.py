@@ -0,0 +1,235 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import os
+import queue
+import threading
+from typing import Union
+from concurrent.futures import ProcessPoolExecutor, Future
+
+import pandas as pd
+
+from config import Configuration as cfg
+from logger import get_cls_logger
+from signal_processor import SignalProcessor
+from signal_grapher import SignalGrapher
+from page_renderer import PageRenderer
+from report_generator import ReportGenerator
+from report_writer import ReportWriter
+from result_cache import ResultCache
+from capture_archive import CaptureArchive
+from channel_timing import ChannelTiming
+from analyzer_controller import AnalyzerController
+from replay_source import ReplaySource
+from run_metrics import RunMetrics
+
+
+def render_report(
+    signals_df: Union[pd.DataFrame, ReplaySource],
+    report_file: str,
+    attempt_number: int,
+    capture_date: str,
+) -> tuple:
+    """
+    Process captured signals and render the report files in memory.
+    Runs in a worker process of the pipeline. With CACHE_ENABLED, results
+    of a capture processed before are taken from the result cache. Replay
+    sources are processed window by window, never loaded whole.
+
+    :return: Tuple of report file path and contents of the report files
+        (PDF report, pulse width CSV and capture archive) by their paths.
+    """
+    # A run of its own in pipeline workers, stages of the caller's run otherwise
+    with RunMetrics.run(os.path.basename(report_file)) as metrics:
+        with RunMetrics.stage("cache"):
+            cache = ResultCache() if cfg.CACHE_ENABLED else None
+            key = cache.key(signals_df) if cache else None
+            cached = cache.load(key) if cache else None
+
+        figure_pdf = cached["figure_pdf"] if cached else None
+        grapher = None
+        replay = isinstance(signals_df, ReplaySource)
+        if cached:
+            processor = SignalProcessor.from_results(
+                None if replay else signals_df,
+                cached["filtered_edges"],
+                cached["pulse_table"],
+                cached["rising"],
+                cached["glitches"],
+            )
+        else:
+            if replay:
+                processor = SignalProcessor.from_replay_source(signals_df)
+            else:
+                processor = SignalProcessor(signals_df)
+
+            if cfg.REPORT_PAGES:
+                figure_pdf = PageRenderer.render(
+                    processor.filtered_edges,
+                    processor.pulse_points_width,
+                    processor.rising_signals,
+                )
+            else:
+                grapher = SignalGrapher(
+                    filtered_edges=processor.filtered_edges,
+                    pulse_counts=processor.pulse_count,
+                    pulse_points_width=processor.pulse_points_width,
+                    rising_signals=processor.rising_signals,
+                )
+                with RunMetrics.stage("plot"):
+                    grapher.plot_signals()
+
+        generator = ReportGenerator(
+            figure=grapher.figure if grapher else None,
+            report_file=report_file,
+            attempt_number=attempt_number,
+            capture_date=capture_date,
+            figure_pdf=figure_pdf,
+        )
+        if cfg.PULSE_STATS:
+            generator.add_table(
+                processor.pulse_stats, generator.PULSE_STATS_COLUMNS, "Channel"
+            )
+        if cfg.CHANNEL_TIMING:
+            with RunMetrics.stage("timing"):
+                channel_timing = ChannelTiming(processor.pulse_points_width).timing
+            generator.add_table(
+                channel_timing, generator.CHANNEL_TIMING_COLUMNS, "Channels"
+            )
+        if cfg.METRICS_FOOTER and metrics:
+            generator.add_text(
+                metrics.summary(), cfg.METRICS_POINT, cfg.METRICS_FONT_SIZE
+            )
+        with RunMetrics.stage("compose"):
+            report_pdf = generator.render_report()
+
+        if grapher:
+            grapher.close()
+        if cache and not cached:
+            with RunMetrics.stage("cache"):
+                cache.save(
+                    key,
+                    processor.filtered_edges,
+                    processor.pulse_table,
+                    processor.rising,
+                    processor.glitches,
+                    generator.figure_pdf,
+                )
+
+        with RunMetrics.stage("csv"):
+            files = {
+                report_file: report_pdf,
+                generator.pulse_width_csv_file: generator.render_pulse_width_csv(
+                    processor.pulse_width
+                ).encode("utf-8"),
+            }
+            if cfg.PULSE_STATS:
+                stats_csv = generator.render_table_csv(processor.pulse_stats)
+                files[generator.pulse_stats_csv_file] = stats_csv.encode("utf-8")
+            if cfg.CHANNEL_TIMING:
+                timing_csv = generator.render_table_csv(channel_timing)
+                files[generator.channel_timing_csv_file] = timing_csv.encode("utf-8")
+        if cfg.ARCHIVE_CAPTURES:
+            with RunMetrics.stage("archive"):
+                if replay:
+                    from_signals = CaptureArchive.from_replay_source
+                else:
+                    from_signals = CaptureArchive.from_dataframe
+                archive = from_signals(
+                    signals_df,
+                    processor.pulse_table,
+                    {
+                        "date": capture_date,
+                        "index": attempt_number,
+                        **AnalyzerController.capture_metadata(),
+                    },
+                )
+                files[generator.capture_archive_file] = archive.to_bytes()
+    return report_file, files
+
+
+class ReportPipeline:
+    """
+    Class to render and write reports in the background.
+
+    Captured signals are processed, plotted and merged into PDF reports on a
+    process pool, while a writer thread hands finished reports to the report
+    writer in submission order. Both stages are bounded by PIPELINE_QUEUE_SIZE,
+    so submit() blocks instead of piling up captures when rendering falls
+    behind.
+
+    Workers are forked at start by Preloader.fork_workers(), before any other
+    thread of the process is started, and preload the processing modules
+    themselves, so the pipeline is created only once the main process has
+    imported them in the background as well.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    def __init__(self, executor: ProcessPoolExecutor, report_writer: ReportWriter):
+        """
+        Initialize ReportPipeline and start writing rendered reports.
+
+        :param executor: Process pool of forked workers rendering reports.
+        :param report_writer: Writer of the rendered report files.
+        """
+        self.executor = executor
+        self.report_writer = report_writer
+        self.reports: queue.Queue = queue.Queue(maxsize=cfg.PIPELINE_QUEUE_SIZE)
+        self.writer = threading.Thread(target=self._write_reports, daemon=True)
+        self.writer.start()
+
+        self.logger.debug("Initialized %s", self.__class__.__name__)
+
+    def submit(
+        self,
+        signals_df: Union[pd.DataFrame, ReplaySource],
+        report_file: str,
+        attempt_number: int,
+        capture_date: str,
+    ) -> None:
+        """Queue captured signals for rendering and writing a report."""
+        future = self.executor.submit(
+            RunMetrics.call_in_worker,
+            render_report,
+            signals_df,
+            report_file,
+            attempt_number,
+            capture_date,
+        )
+        self.reports.put((report_file, future))
+        self.logger.debug("Report %s queued", report_file)
+
+    def close(self) -> None:
+        """Wait for queued reports to be written."""
+        self.reports.put(None)
+        self.writer.join()
+        self.logger.debug("Pipeline closed")
+
+    def _write_reports(self) -> None:
+        """Write rendered reports in submission order."""
+        while True:
+            item = self.reports.get()
+            if item is None:
+                self.reports.task_done()
+                break
+            report_file, future = item
+            try:
+                self._write_report(future)
+            except Exception as e:  # pylint: disable=broad-except
+                self.logger.error("Failed to write report %s: %s", report_file, e)
+            finally:
+                self.reports.task_done()
+
+    def _write_report(self, future: Future) -> None:
+        """Write report files once the worker has rendered them."""
+        result, records = future.result()
+        RunMetrics.save_records(records)
+        self.report_writer.write(*result)
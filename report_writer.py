@@ -0,0 +1,328 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import os
+import json
+import time
+import queue
+import shutil
+import threading
+
+from config import Configuration as cfg
+from logger import get_cls_logger
+from run_metrics import RunMetrics
+
+
+class ReportWriter:
+    """
+    Class to write report files to the USB drive.
+
+    Every file of a report is written to a temporary file next to its
+    target and synced, then renamed into place, so a pulled drive never
+    leaves a half-written report behind.
+
+    With WRITE_BEHIND the report files are staged in STAGING_DIR (tmpfs)
+    and write() returns right away. A flusher thread copies staged reports
+    to the drive in order. While the drive is gone they stay staged and are
+    retried every FLUSH_RETRY_INTERVAL, also after a service restart. A
+    report that fails goes to the back of the queue, so it never holds up
+    the others, and after FLUSH_MAX_ATTEMPTS failed writes to a present
+    drive it is moved to FAILED_DIR. Staged reports that would replace other
+    files, e.g. on another drive plugged in meanwhile, get a numbered suffix.
+
+    Staging only covers a drive that goes away after a report is staged:
+    the main loop still waits for a drive ready to write before every
+    capture, as report names are numbered from the reports on the drive.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    STAGE_FILE = "report.json"
+
+    def __init__(self, on_written: callable = None, data_dir: callable = None):
+        """
+        Initialize ReportWriter.
+
+        :param on_written: Called with the report file path once the report
+            files are on the drive, from the flusher thread with WRITE_BEHIND.
+        :param data_dir: Returns the current data directory of the drive, or
+            None while it is away. Staged reports are written there, as the
+            drive may be mounted elsewhere by then. By default they are
+            written to the directory they were staged for.
+        """
+        self.on_written = on_written
+        self.data_dir = data_dir
+        self.staged: queue.Queue = queue.Queue()
+        self.thread = None
+        self._closing = threading.Event()
+        # Failed writes and the next retry time of staged reports
+        self._attempts = {}
+        self._retry_at = {}
+
+        if cfg.WRITE_BEHIND:
+            os.makedirs(cfg.STAGING_DIR, exist_ok=True)
+            for stage_dir in self._recover_staged_reports():
+                self.staged.put(stage_dir)
+            self.thread = threading.Thread(target=self._flush_reports, daemon=True)
+            self.thread.start()
+
+        self.logger.debug("Initialized %s", self.__class__.__name__)
+
+    @property
+    def pending(self) -> int:
+        """Number of staged reports not yet flushed to the drive."""
+        return self.staged.unfinished_tasks
+
+    def write(self, report_file: str, files: dict) -> None:
+        """
+        Write the files of a report, or stage them to be written in the
+        background with WRITE_BEHIND.
+
+        :param report_file: Path of the PDF report.
+        :param files: Contents of the report files by their paths.
+        """
+        if self.thread is None:
+            self._write_files(files)
+            self._written(report_file)
+            return
+
+        with RunMetrics.stage("staging"):
+            self.staged.put(self._stage(report_file, files))
+        self.logger.debug("Report %s staged", report_file)
+
+    def close(self) -> None:
+        """
+        Flush staged reports and stop the flusher thread. Reports that cannot
+        be flushed now are left staged for the next start.
+        """
+        if self.thread is None:
+            return
+        self._closing.set()
+        self.staged.put(None)
+        self.thread.join()
+        self.logger.debug("Writer closed, %d reports left staged", self.pending)
+
+    def _stage(self, report_file: str, files: dict) -> str:
+        """Save report files to a new staging directory."""
+        stage_dir = os.path.join(cfg.STAGING_DIR, str(time.time_ns()))
+        os.mkdir(stage_dir)
+        for i, data in enumerate(files.values()):
+            with open(os.path.join(stage_dir, str(i)), "wb") as fp:
+                fp.write(data)
+
+        # The description is written last, it marks the staged report complete
+        stage = {"report_file": report_file, "files": list(files)}
+        with open(
+            os.path.join(stage_dir, self.STAGE_FILE + ".tmp"), "w", encoding="utf-8"
+        ) as fp:
+            json.dump(stage, fp)
+        os.replace(
+            os.path.join(stage_dir, self.STAGE_FILE + ".tmp"),
+            os.path.join(stage_dir, self.STAGE_FILE),
+        )
+        return stage_dir
+
+    def _recover_staged_reports(self) -> list:
+        """Find reports staged before a restart and drop incomplete ones."""
+        stage_dirs = []
+        names = [name for name in os.listdir(cfg.STAGING_DIR) if name.isdigit()]
+        for name in sorted(names, key=int):
+            stage_dir = os.path.join(cfg.STAGING_DIR, name)
+            if os.path.exists(os.path.join(stage_dir, self.STAGE_FILE)):
+                stage_dirs.append(stage_dir)
+            else:
+                shutil.rmtree(stage_dir, ignore_errors=True)
+        if stage_dirs:
+            self.logger.info("Recovered %d staged reports", len(stage_dirs))
+        return stage_dirs
+
+    def _flush_reports(self) -> None:
+        """Flush staged reports in order, retrying while the drive is away."""
+        while True:
+            stage_dir = self.staged.get()
+            if stage_dir is None:
+                self.staged.task_done()
+                break
+            delay = self._retry_at.get(stage_dir, 0) - time.monotonic()
+            if delay > 0 and self._closing.wait(delay):
+                # Tried already, left staged for the next start
+                continue
+            if self._flush(stage_dir):
+                self._attempts.pop(stage_dir, None)
+                self._retry_at.pop(stage_dir, None)
+                self.staged.task_done()
+            elif not self._closing.is_set():
+                # Retried after the reports staged behind it
+                self._retry_at[stage_dir] = time.monotonic() + cfg.FLUSH_RETRY_INTERVAL
+                self.staged.put(stage_dir)
+                self.staged.task_done()
+
+    def _target_dir(self, report_file: str) -> str:
+        """Directory to write a staged report to, None while the drive is away."""
+        if self.data_dir is not None:
+            return self.data_dir()
+        target_dir = os.path.dirname(report_file)
+        return target_dir if os.path.isdir(target_dir) else None
+
+    def _flush(self, stage_dir: str) -> bool:
+        """
+        Write a staged report to the drive and remove it from staging.
+        A report that failed FLUSH_MAX_ATTEMPTS times is moved to FAILED_DIR.
+
+        :return: True if the report is out of staging.
+        """
+        try:
+            with open(
+                os.path.join(stage_dir, self.STAGE_FILE), "r", encoding="utf-8"
+            ) as fp:
+                stage = json.load(fp)
+            target_dir = self._target_dir(stage["report_file"])
+            if target_dir is None:
+                self.logger.debug("Report %s waits for the drive", stage_dir)
+                return False
+            report_file = os.path.join(
+                target_dir, os.path.basename(stage["report_file"])
+            )
+            files = {}
+            for i, path in enumerate(stage["files"]):
+                with open(os.path.join(stage_dir, str(i)), "rb") as fp:
+                    files[os.path.join(target_dir, os.path.basename(path))] = fp.read()
+            report_file, files = self._free_names(report_file, files)
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.error("Staged report %s dropped: %s", stage_dir, e)
+            shutil.rmtree(stage_dir, ignore_errors=True)
+            return True
+
+        try:
+            # Written in the background, a run of its own
+            with RunMetrics.run(os.path.basename(report_file)):
+                self._write_files(files)
+        except OSError as e:
+            self._attempts[stage_dir] = self._attempts.get(stage_dir, 0) + 1
+            if self._attempts[stage_dir] < cfg.FLUSH_MAX_ATTEMPTS:
+                self.logger.warning("Report %s not written yet: %s", report_file, e)
+                return False
+            self.logger.error("Report %s not written, moved aside: %s", report_file, e)
+            self._move_to_failed(stage_dir)
+            return True
+
+        shutil.rmtree(stage_dir, ignore_errors=True)
+        self._written(report_file)
+        return True
+
+    def _free_names(self, report_file: str, files: dict) -> tuple:
+        """
+        Rename report files that would replace other files on the drive with
+        a numbered suffix, e.g. ``2024-04-01-003-1.pdf``. Files already
+        written by an earlier attempt of the same report are replaced.
+
+        :return: Tuple of the report file path and the report files.
+        """
+        stem = os.path.splitext(os.path.basename(report_file))[0]
+        renamed_stem, number = stem, 0
+        while True:
+            renamed = {
+                os.path.join(
+                    os.path.dirname(path),
+                    renamed_stem + os.path.basename(path)[len(stem) :],
+                ): data
+                for path, data in files.items()
+            }
+            if not any(self._taken(path, data) for path, data in renamed.items()):
+                break
+            number += 1
+            renamed_stem = f"{stem}-{number}"
+        if number:
+            self.logger.warning(
+                "Report %s exists on the drive, saved as %s", stem, renamed_stem
+            )
+        return (
+            os.path.join(
+                os.path.dirname(report_file),
+                renamed_stem + os.path.basename(report_file)[len(stem) :],
+            ),
+            renamed,
+        )
+
+    @staticmethod
+    def _taken(path: str, data: bytes) -> bool:
+        """Check if a path holds a file other than the given contents."""
+        try:
+            if os.path.getsize(path) != len(data):
+                return True
+            with open(path, "rb") as fp:
+                return fp.read() != data
+        except FileNotFoundError:
+            return False
+
+    def _move_to_failed(self, stage_dir: str) -> None:
+        """Move a staged report out of the queue to FAILED_DIR."""
+        try:
+            os.makedirs(cfg.FAILED_DIR, exist_ok=True)
+            shutil.move(
+                stage_dir,
+                os.path.join(cfg.FAILED_DIR, os.path.basename(stage_dir)),
+            )
+        except OSError as e:
+            self.logger.error("Staged report %s dropped: %s", stage_dir, e)
+            shutil.rmtree(stage_dir, ignore_errors=True)
+
+    def _write_files(self, files: dict) -> None:
+        """Write files atomically, syncing only the files written."""
+        tmp_files = [path + ".tmp" for path in files]
+        try:
+            with RunMetrics.stage("usb write"):
+                for tmp_file, data in zip(tmp_files, files.values()):
+                    # Buffered writes raise instead of writing short, e.g. on
+                    # a full drive, so no truncated file is renamed into place
+                    with open(tmp_file, "wb") as fp:
+                        fp.write(data)
+            with RunMetrics.stage("usb sync"):
+                for tmp_file in tmp_files:
+                    self._sync_file(tmp_file)
+                for tmp_file, path in zip(tmp_files, files):
+                    os.replace(tmp_file, path)
+                # Persist the renames
+                self._sync_directories(files)
+        except OSError:
+            for tmp_file in tmp_files:
+                try:
+                    os.remove(tmp_file)
+                except OSError:
+                    pass
+            raise
+
+    @staticmethod
+    def _sync_file(path: str) -> None:
+        """Persist the contents of a file."""
+        fd = os.open(path, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _sync_directories(files: dict) -> None:
+        """Persist renames of the files in their directories."""
+        for directory in {os.path.dirname(path) for path in files}:
+            fd = os.open(directory, os.O_RDONLY)
+            try:
+                os.fsync(fd)
+            finally:
+                os.close(fd)
+
+    def _written(self, report_file: str) -> None:
+        """Report that the report files are on the drive."""
+        self.logger.debug("Report file %s saved.", report_file)
+        if self.on_written is not None:
+            try:
+                self.on_written(report_file)
+            except OSError as e:
+                self.logger.warning("Report %s not recorded: %s", report_file, e)
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import os
+import hashlib
+from typing import Union
+
+import numpy as np
+import pandas as pd
+
+from config import Configuration as cfg
+from logger import get_cls_logger
+from signal_edges import SignalEdges
+from replay_source import ReplaySource
+
+
+class ResultCache:
+    """
+    Class to cache processing results of captures on local disk.
+
+    Entries are keyed by a hash of the captured samples and the settings
+    that change the results, and hold the filtered edge lists, the pulse
+    table and the figure saved to PDF. Every entry is one NPZ file, reading
+    it refreshes its mtime, and the least recently used entries are removed
+    when the cache grows over CACHE_SIZE_LIMIT.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    # Bump when the format or meaning of cached results changes
+    VERSION = 2
+
+    # Settings that change processing results or the figure
+    KEY_FIELDS = (
+        "FILTER_WSIZE",
+        "PLOT_WIDTH",
+        "SHOW_GRID",
+        "TIME_UNITS",
+        # Sample rate of pulse width labels and time ticks
+        "CAPTURE_COMMAND",
+        "COLORS",
+        "RENDER_ENGINE",
+        "RENDER_BINS_PER_PIXEL",
+        "ANNOTATION_ENGINE",
+        "LABEL_SPACING",
+        "RASTER_TRACES",
+        "RASTER_DPI",
+        "RASTER_MIN_DPI",
+        "FIGURE_PDF_BUDGET",
+        "REPORT_PAGES",
+        "PAGE_SAMPLES",
+        "PAGE_CHANNELS",
+    )
+
+    def __init__(self, cache_dir: str = None):
+        """
+        Initialize ResultCache.
+
+        :param cache_dir: Cache directory, CACHE_DIR by default.
+        """
+        self.cache_dir = cache_dir or cfg.CACHE_DIR
+        os.makedirs(self.cache_dir, exist_ok=True)
+
+        self.logger.debug("Initialized %s", self.__class__.__name__)
+
+    def key(self, signals_df: Union[pd.DataFrame, ReplaySource]) -> str:
+        """
+        Hash of the captured samples and the result settings. Replay sources
+        are hashed by their packed samples, a chunk at a time.
+        """
+        digest = hashlib.blake2b(digest_size=20)
+        settings = [self.VERSION, list(signals_df.columns), len(signals_df)]
+        settings += [getattr(cfg, field) for field in self.KEY_FIELDS]
+        if isinstance(signals_df, ReplaySource):
+            settings += ["replay", signals_df.bits, signals_df.unitsize]
+            digest.update(repr(settings).encode("utf-8"))
+            for start in range(0, len(signals_df), cfg.REPLAY_CHUNK_SIZE):
+                digest.update(
+                    signals_df.packed[start : start + cfg.REPLAY_CHUNK_SIZE].tobytes()
+                )
+            return digest.hexdigest()
+
+        digest.update(repr(settings).encode("utf-8"))
+        for col in signals_df.columns:
+            digest.update(
+                np.ascontiguousarray(signals_df[col].to_numpy(), dtype=np.int8)
+            )
+        return digest.hexdigest()
+
+    def _entry_file(self, key: str) -> str:
+        """Path of a cache entry."""
+        return os.path.join(self.cache_dir, f"{key}.npz")
+
+    def load(self, key: str) -> dict:
+        """
+        Load cached results.
+
+        :return: Dictionary of filtered_edges, pulse_table, rising, glitches
+            and figure_pdf, or None on a cache miss.
+        """
+        entry_file = self._entry_file(key)
+        try:
+            with np.load(entry_file, allow_pickle=False) as entry:
+                results = {
+                    "filtered_edges": SignalEdges(
+                        entry["columns"].tolist(),
+                        int(entry["length"]),
+                        entry["initial"],
+                        entry["positions"],
+                        entry["offsets"],
+                    ),
+                    "pulse_table": entry["pulse_table"],
+                    "rising": entry["rising"],
+                    "glitches": entry["glitches"],
+                    "figure_pdf": entry["figure_pdf"].tobytes(),
+                }
+            os.utime(entry_file)
+        except FileNotFoundError:
+            self.logger.debug("Cache miss %s", key)
+            return None
+        except (OSError, ValueError, KeyError) as e:
+            self.logger.warning("Cache entry %s dropped: %s", key, e)
+            self._remove(entry_file)
+            return None
+
+        self.logger.debug("Cache hit %s", key)
+        return results
+
+    def save(
+        self,
+        key: str,
+        filtered_edges: SignalEdges,
+        pulse_table: np.ndarray,
+        rising: np.ndarray,
+        glitches: np.ndarray,
+        figure_pdf: bytes,
+    ) -> None:
+        """Save results to the cache and evict old entries over the limit."""
+        entry_file = self._entry_file(key)
+        tmp_file = f"{entry_file}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_file, "wb") as fp:
+                np.savez(
+                    fp,
+                    columns=np.array(filtered_edges.columns, dtype=str),
+                    length=filtered_edges.length,
+                    initial=filtered_edges.initial,
+                    positions=filtered_edges.positions,
+                    offsets=filtered_edges.offsets,
+                    pulse_table=pulse_table,
+                    rising=rising,
+                    glitches=glitches,
+                    figure_pdf=np.frombuffer(figure_pdf, dtype=np.uint8),
+                )
+            os.replace(tmp_file, entry_file)
+        except OSError as e:
+            self.logger.warning("Cache entry %s not saved: %s", key, e)
+            self._remove(tmp_file)
+            return
+
+        self.logger.debug("Cache entry %s saved", key)
+        self._evict()
+
+    def _evict(self) -> None:
+        """Remove least recently used entries while over the size limit."""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(".npz"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime_ns, stat.st_size, entry.path))
+
+        size = sum(entry_size for _, entry_size, _ in entries)
+        for _, entry_size, path in sorted(entries):
+            if size <= cfg.CACHE_SIZE_LIMIT:
+                break
+            self._remove(path)
+            size -= entry_size
+            self.logger.debug("Cache entry %s evicted", path)
+
+    @staticmethod
+    def _remove(path: str) -> None:
+        """Remove a file if it exists."""
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,211 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import os
+import json
+import time
+import logging
+import resource
+import threading
+import tracemalloc
+import contextlib
+from logging.handlers import RotatingFileHandler
+
+from config import Configuration as cfg
+from logger import get_cls_logger
+
+_MB = 2**20
+
+
+class RunMetrics:
+    """
+    Class to measure stages of a run, e.g. a button press from capture to
+    the report on the drive.
+
+    A run is active in the thread that started it, and stages measured
+    anywhere in that thread while it runs are recorded to it, so classes
+    only wrap their steps in ``RunMetrics.stage()``. Outside of a run, or
+    with METRICS_ENABLED off, a stage is an empty context. Finished runs
+    are logged and appended as JSON lines to the rolling METRICS_FILE.
+    With METRICS_MEMORY, stages also record the peak of Python memory
+    allocated (tracemalloc) and the resident set size of the process.
+    Processes cannot share the rolling file, so worker processes run their
+    tasks with call_in_worker() and hand the metrics to the parent.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    _local = threading.local()
+    _metrics_log: logging.Logger = None
+
+    def __init__(self, name: str):
+        """
+        Initialize RunMetrics.
+
+        :param name: Name of the run in the metrics.
+        """
+        self.name = name
+        # Forked processes inherit the run but do not measure it
+        self.pid = os.getpid()
+        self.date = time.strftime("%Y-%m-%d %H:%M:%S")
+        self.stages: dict = {}
+        self.total = 0.0
+        # Peaks of the stages being measured, outermost first
+        self._peaks: list = []
+
+        self.logger.debug("Initialized %s", self.__class__.__name__)
+
+    @classmethod
+    def current(cls) -> "RunMetrics":
+        """Run active in the calling thread, None if there is none."""
+        metrics = getattr(cls._local, "run", None)
+        if metrics is None or metrics.pid != os.getpid():
+            return None
+        return metrics
+
+    @classmethod
+    @contextlib.contextmanager
+    def run(cls, name: str):
+        """
+        Measure a run in the calling thread. Inside another run the stages
+        are recorded to the outer run instead. Runs that raise are dropped.
+        """
+        if not cfg.METRICS_ENABLED or cls.current() is not None:
+            yield cls.current()
+            return
+
+        if cfg.METRICS_MEMORY and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        metrics = cls(name)
+        cls._local.run = metrics
+        start = time.perf_counter()
+        try:
+            yield metrics
+        finally:
+            cls._local.run = None
+        metrics.total = time.perf_counter() - start
+        metrics.save()
+
+    @classmethod
+    def stage(cls, name: str) -> contextlib.AbstractContextManager:
+        """Measure a stage of the active run, if any."""
+        metrics = cls.current()
+        if metrics is None:
+            return contextlib.nullcontext()
+        return metrics.measure(name)
+
+    @contextlib.contextmanager
+    def measure(self, name: str):
+        """Measure a stage. Durations of repeated stages are added up."""
+        tracing = cfg.METRICS_MEMORY and tracemalloc.is_tracing()
+        if tracing:
+            in_use, peak = tracemalloc.get_traced_memory()
+            if self._peaks:
+                self._peaks[-1] = max(self._peaks[-1], peak)
+            tracemalloc.reset_peak()
+            self._peaks.append(in_use)
+
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            stage = self.stages.setdefault(name, {"s": 0.0})
+            stage["s"] += time.perf_counter() - start
+            if tracing:
+                # The enclosing stage keeps the peak of this one
+                peak = max(self._peaks.pop(), tracemalloc.get_traced_memory()[1])
+                if self._peaks:
+                    self._peaks[-1] = max(self._peaks[-1], peak)
+                stage["peak_mb"] = round((peak - in_use) / _MB, 2)
+                stage["rss_mb"] = round(self._rss() / _MB, 1)
+
+    def summary(self) -> str:
+        """Durations of the stages measured so far in one line."""
+        return ", ".join(
+            f"{name} {stage['s']:.2f} s" for name, stage in self.stages.items()
+        )
+
+    def to_dict(self) -> dict:
+        """Metrics of the run as a JSON serializable dictionary."""
+        metrics = {
+            "run": self.name,
+            "date": self.date,
+            "total_s": round(self.total, 4),
+            "stages": {
+                name: {**stage, "s": round(stage["s"], 4)}
+                for name, stage in self.stages.items()
+            },
+        }
+        if cfg.METRICS_MEMORY:
+            # Kilobytes on Linux
+            metrics["max_rss_mb"] = round(
+                resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1
+            )
+        return metrics
+
+    def save(self) -> None:
+        """
+        Log the metrics and append them to the metrics file, or collect them
+        for the parent process in call_in_worker().
+        """
+        collected = getattr(self._local, "collected", None)
+        if collected is not None:
+            collected.append(self.to_dict())
+            return
+        self.save_records([self.to_dict()])
+
+    @classmethod
+    def save_records(cls, records: list) -> None:
+        """Log metrics records and append them to the metrics file."""
+        for record in records:
+            line = json.dumps(record)
+            cls.logger.info("Run metrics: %s", line)
+            cls.metrics_log().info(line)
+
+    @classmethod
+    def call_in_worker(cls, func: callable, *args) -> tuple:
+        """
+        Call a function in a worker process, collecting the metrics of the
+        runs it measures instead of saving them.
+
+        :return: Tuple of the function result and the metrics records, to be
+            saved by the parent process with save_records().
+        """
+        cls._local.collected = records = []
+        try:
+            return func(*args), records
+        finally:
+            cls._local.collected = None
+
+    @classmethod
+    def metrics_log(cls) -> logging.Logger:
+        """Logger writing JSON lines to the rolling metrics file."""
+        if cls._metrics_log is None:
+            cls._metrics_log = logging.getLogger("metrics")
+            cls._metrics_log.propagate = False
+            cls._metrics_log.setLevel(logging.INFO)
+            if not cls._metrics_log.handlers:
+                cls._metrics_log.addHandler(
+                    RotatingFileHandler(
+                        cfg.METRICS_FILE,
+                        maxBytes=cfg.METRICS_FILE_SIZE,
+                        backupCount=cfg.METRICS_FILE_BACKUPS,
+                    )
+                )
+        return cls._metrics_log
+
+    @staticmethod
+    def _rss() -> int:
+        """Resident set size of the process in bytes."""
+        try:
+            with open("/proc/self/statm", "r", encoding="utf-8") as fp:
+                return int(fp.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+        except (OSError, ValueError, IndexError):
+            return 0
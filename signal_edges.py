@@ -0,0 +1,271 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import numpy as np
+import pandas as pd
+
+
+class SignalEdges:
+    """
+    Run-length (edge list) representation of binary logic signals.
+
+    Every channel is kept as its initial level and the sorted sample indices
+    where its level toggles. Positions of all channels are concatenated into
+    one array and sliced by ``offsets``, so memory scales with the number of
+    edges instead of the number of samples.
+    """
+
+    def __init__(
+        self,
+        columns: list,
+        length: int,
+        initial: np.ndarray,
+        positions: np.ndarray,
+        offsets: np.ndarray,
+    ) -> None:
+        """
+        Initialize SignalEdges.
+
+        :param columns: Channel names.
+        :param length: Number of samples of each channel.
+        :param initial: Level of the first sample of each channel.
+        :param positions: Concatenated indices of the first sample after each edge.
+        :param offsets: Start of each channel in positions, plus the total size.
+        """
+        self.columns = list(columns)
+        self.length = length
+        self.initial = np.asarray(initial, dtype=np.int8)
+        self.positions = np.asarray(positions, dtype=np.int64)
+        self.offsets = np.asarray(offsets, dtype=np.int64)
+
+    @classmethod
+    def from_matrix(cls, matrix: np.ndarray, columns: list) -> "SignalEdges":
+        """Build edge lists from a (samples, channels) matrix of 0/1 levels."""
+        matrix = np.asarray(matrix)
+        channel_positions = [
+            np.flatnonzero(matrix[1:, i] != matrix[:-1, i]) + 1
+            for i in range(matrix.shape[1])
+        ]
+        return cls._from_channels(
+            columns,
+            matrix.shape[0],
+            [
+                matrix[0, i] != 0 if matrix.shape[0] else 0
+                for i in range(matrix.shape[1])
+            ],
+            channel_positions,
+        )
+
+    @classmethod
+    def from_dataframe(cls, df: pd.DataFrame) -> "SignalEdges":
+        """Build edge lists from a DataFrame of 0/1 signals."""
+        return cls.from_matrix(df.to_numpy(), list(df.columns))
+
+    @classmethod
+    def _from_channels(
+        cls, columns: list, length: int, initial: list, channel_positions: list
+    ) -> "SignalEdges":
+        """Pack per-channel edge positions into one SignalEdges."""
+        offsets = np.zeros(len(channel_positions) + 1, dtype=np.int64)
+        np.cumsum([len(pos) for pos in channel_positions], out=offsets[1:])
+        positions = (
+            np.concatenate(channel_positions)
+            if channel_positions
+            else np.empty(0, dtype=np.int64)
+        )
+        return cls(columns, length, initial, positions, offsets)
+
+    def __getitem__(self, col: str) -> np.ndarray:
+        """Edge positions of a channel."""
+        i = self.columns.index(col)
+        return self.positions[self.offsets[i] : self.offsets[i + 1]]
+
+    def initial_level(self, col: str) -> int:
+        """Level of the first sample of a channel."""
+        return int(self.initial[self.columns.index(col)])
+
+    def levels(self, col: str) -> np.ndarray:
+        """Level of a channel after each of its edges."""
+        return (self.initial_level(col) + 1 + np.arange(len(self[col]))) % 2
+
+    def pivots(self, col: str) -> np.ndarray:
+        """Edge positions of a channel in ``np.diff`` index convention."""
+        return self[col] - 1
+
+    @property
+    def edge_counts(self) -> dict:
+        """Number of edges of each channel."""
+        return dict(zip(self.columns, np.diff(self.offsets).tolist()))
+
+    def level_at(self, col: str, idx: np.ndarray) -> np.ndarray:
+        """Levels of a channel at the given sample indices."""
+        return (
+            self.initial_level(col) + np.searchsorted(self[col], idx, side="right")
+        ) % 2
+
+    def step_points(self, col: str) -> tuple:
+        """
+        Sample indices and levels that draw the same ``step`` plot as all
+        samples of a channel: its ends and both samples around every edge.
+        """
+        positions = self[col]
+        idx = np.unique(
+            np.concatenate(([0], positions - 1, positions, [self.length - 1]))
+        )
+        idx = idx[(idx >= 0) & (idx < self.length)]
+        return idx, self.level_at(col, idx)
+
+    def minmax_points(self, col: str, bins: int) -> tuple:
+        """
+        Min/max decimated points of a channel for ``steps-post`` drawing.
+        Every bin gets its start level, the opposite level when it holds an
+        edge, and its end level.
+        """
+        positions = self[col]
+        starts = np.unique(np.linspace(0, self.length, bins + 1).astype(np.int64))
+        starts, ends = starts[:-1], starts[1:]
+
+        start_level = self.level_at(col, starts)
+        end_level = self.level_at(col, ends - 1)
+        has_edge = np.searchsorted(positions, ends - 1, side="right") > np.searchsorted(
+            positions, starts, side="right"
+        )
+        mid_level = np.where(has_edge, 1 - start_level, start_level)
+
+        x = np.append(np.repeat(starts, 3), self.length - 1)
+        y = np.append(
+            np.column_stack((start_level, mid_level, end_level)).ravel(), end_level[-1:]
+        )
+        return x, y
+
+    def crop(self, start: int, stop: int, offset: int = 0) -> "SignalEdges":
+        """
+        Edges of the samples from start to stop, moved by offset. The edge
+        into the start sample is kept, so crops of adjacent sample ranges
+        concatenate back into the edges of the whole range.
+        """
+        channel_positions = []
+        for col in self.columns:
+            positions = self[col]
+            first, last = np.searchsorted(positions, (start, stop))
+            channel_positions.append(positions[first:last] + offset)
+        initial = [int(self.level_at(col, start)) for col in self.columns]
+        return self._from_channels(
+            self.columns, stop - start, initial, channel_positions
+        )
+
+    def window(self, start: int, stop: int, columns: list = None) -> "SignalEdges":
+        """
+        Edges of the samples from start to stop of some channels as signals
+        of their own, with positions counted from start.
+        """
+        columns = self.columns if columns is None else list(columns)
+        channel_positions = []
+        for col in columns:
+            positions = self[col]
+            first = np.searchsorted(positions, start, side="right")
+            last = np.searchsorted(positions, stop)
+            channel_positions.append(positions[first:last] - start)
+        initial = [int(self.level_at(col, start)) for col in columns]
+        return self._from_channels(columns, stop - start, initial, channel_positions)
+
+    @classmethod
+    def concatenate(cls, parts: list, length: int) -> "SignalEdges":
+        """Join crops of successive sample ranges into edges of all samples."""
+        return cls._from_channels(
+            parts[0].columns,
+            length,
+            parts[0].initial,
+            [np.concatenate([part[col] for part in parts]) for col in parts[0].columns],
+        )
+
+    def to_matrix(self) -> np.ndarray:
+        """Expand edge lists back to a (samples, channels) int8 matrix."""
+        matrix = np.empty((len(self.columns), self.length), dtype=np.int8)
+        for i, col in enumerate(self.columns):
+            bounds = np.concatenate(([0], self[col], [self.length]))
+            run_levels = (self.initial[i] + np.arange(len(bounds) - 1)) % 2
+            matrix[i] = np.repeat(run_levels.astype(np.int8), np.diff(bounds))
+        return matrix.T
+
+    def to_dataframe(self) -> pd.DataFrame:
+        """Expand edge lists back to a DataFrame of signals."""
+        return pd.DataFrame(self.to_matrix(), columns=self.columns, copy=False)
+
+    def median_filter(self, wsize: int) -> "SignalEdges":
+        """
+        Median filter every channel directly on its edge list.
+        Matches ``scipy.signal.medfilt`` with zero padding for odd wsize.
+        """
+        initial = []
+        channel_positions = []
+        for i, col in enumerate(self.columns):
+            level, positions = self._median_filter_channel(
+                self[col], int(self.initial[i]), self.length, wsize
+            )
+            initial.append(level)
+            channel_positions.append(positions)
+        return self._from_channels(
+            self.columns, self.length, initial, channel_positions
+        )
+
+    @staticmethod
+    def _median_filter_channel(
+        positions: np.ndarray, initial: int, length: int, wsize: int
+    ) -> tuple:
+        """
+        Median filter one channel given by its edge positions.
+
+        For binary data the window median is a majority vote: sample i is high
+        when the window sum S(i) exceeds wsize // 2. S is piecewise linear with
+        slope -1, 0 or 1 that only changes where a window boundary meets an
+        edge, so the output is resolved per linear segment in O(edges).
+        """
+        if length == 0:
+            return 0, np.empty(0, dtype=np.int64)
+        half = wsize // 2
+
+        bounds = np.concatenate(([0], positions, [length]))
+        levels = (initial + np.arange(len(bounds))) % 2
+        levels[-1] = 0  # Zero padding after the last sample
+        ones = np.concatenate(([0], np.cumsum(np.diff(bounds) * levels[:-1])))
+
+        def level_at(idx: np.ndarray) -> np.ndarray:
+            run = np.searchsorted(bounds, idx, side="right") - 1
+            inside = (idx >= 0) & (idx < length)
+            return np.where(inside, levels[np.clip(run, 0, len(levels) - 1)], 0)
+
+        def ones_before(idx: np.ndarray) -> np.ndarray:
+            idx = np.clip(idx, 0, length)
+            run = np.searchsorted(bounds, idx, side="right") - 1
+            return ones[run] + (idx - bounds[run]) * levels[run]
+
+        # Segment starts: every point where a window boundary crosses an edge
+        starts = np.unique(np.concatenate(([0], bounds - half - 1, bounds + half)))
+        starts = starts[(starts >= 0) & (starts < length)]
+        ends = np.append(starts[1:], length)
+
+        window_sum = ones_before(starts + half + 1) - ones_before(starts - half)
+        slope = level_at(starts + half + 1) - level_at(starts - half)
+        high = window_sum > half
+
+        # Sample where the majority flips inside a segment, if it does
+        cross = np.where(
+            slope > 0, starts + half + 1 - window_sum, starts + window_sum - half
+        )
+        flips = ((slope > 0) & ~high | (slope < 0) & high) & (cross < ends)
+
+        event_pos = np.concatenate((starts, cross[flips]))
+        event_level = np.concatenate((high, ~high[flips]))
+        order = np.argsort(event_pos, kind="stable")
+        event_pos, event_level = event_pos[order], event_level[order]
+
+        changes = np.flatnonzero(event_level[1:] != event_level[:-1]) + 1
+        return int(event_level[0]), event_pos[changes].astype(np.int64)
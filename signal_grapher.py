@@ -8,12 +8,22 @@
 
 # This file is part of the analyzer_reporter project
 
+import time
+from collections import OrderedDict
+from typing import NamedTuple
+
+import numpy as np
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib import figure as pltfg
+from matplotlib import lines, markers
+from matplotlib.collections import LineCollection
+from matplotlib.ticker import FuncFormatter
 
 from config import Configuration as cfg
 from logger import get_cls_logger
+from signal_edges import SignalEdges
+from signal_processor import SignalProcessor
 
 
 class SignalGrapher:
@@ -23,10 +33,12 @@ class SignalGrapher:
 
     def __init__(
         self,
-        filtered_signals_df: pd.DataFrame,
-        pulse_counts: dict,
-        pulse_points_width: dict,
-        rising_signals: dict,
+        filtered_signals_df: pd.DataFrame = None,
+        pulse_counts: dict = None,
+        pulse_points_width: dict = None,
+        rising_signals: dict = None,
+        filtered_edges: SignalEdges = None,
+        x_offset: int = 0,
     ) -> None:
         """
         Initialize SignalGrapher.
@@ -34,59 +46,163 @@ class SignalGrapher:
         :param filtered_signals_df: DataFrame of filtered signals.
         :param pulse_counts: Dictionary of pulse counts for each signal.
         :param pulse_points_width: Dictionary of pulse points and widths for each signal.
+        :param rising_signals: Dictionary of rising flags for each signal.
+        :param filtered_edges: Edge lists of filtered signals, used instead of
+            filtered_signals_df by the "edges" and "minmax" render engines.
+        :param x_offset: Time of the first sample, e.g. of a report page.
         """
-        self.filtered_signals_df = filtered_signals_df
+        if filtered_edges is None:
+            filtered_edges = SignalEdges.from_dataframe(filtered_signals_df)
+        self.filtered_edges = filtered_edges
+        self._filtered_signals_df = filtered_signals_df
         self.pulse_counts = pulse_counts
         self.pulse_points_width = pulse_points_width
         self.rising_signals = rising_signals
+        self.x_offset = x_offset
+        # Signals are plotted by sample, pulse widths are labelled in ms
+        self.ms_per_sample = SignalProcessor.ms_per_sample()
         self.signals_to_plot_widths: list = self._get_signals_to_plot()
         self.vlines: list = []
         self.figure: pltfg.Figure = None
+        self.timings: dict = {}
+        # Figure taken from the figure pool, returned by close()
+        self._pooled: PooledFigure = None
 
         self.logger.debug("Initialized %s", self.__class__.__name__)
 
     def plot_signals(self) -> None:
         """Plot signals and pulses."""
-        # Set A4 canvas size in inches
-        a4_width_inches = 8.27
-        a4_height_inches = 11.69
-        bot_mrg = (
-            1 - self.filtered_signals_df.shape[1] / 10
-            if self.filtered_signals_df.shape[1] < 10
-            else 0.1
-        )
+        columns = self.filtered_edges.columns
 
-        fig, axes = plt.subplots(
-            self.filtered_signals_df.shape[1],
-            1,
-            sharex="col",
-            figsize=(a4_width_inches, a4_height_inches * 0.85),
-        )
+        start = time.perf_counter()
+        if cfg.FIGURE_POOL:
+            self._pooled = FigurePool.acquire(columns)
+            _, fig, axes, lines = self._pooled
+        else:
+            fig, axes = self.create_figure(columns, pyplot=True)
+            lines = [None] * len(columns)
+        self.timings["figure"] = time.perf_counter() - start
 
-        for i, col in enumerate(self.filtered_signals_df.columns):
-            axes[i].step(
-                self.filtered_signals_df.index,
-                self.filtered_signals_df[col],
-                cfg.COLORS[i],
-            )
-            axes[i].set_ylabel(col)
+        start = time.perf_counter()
+        for i, col in enumerate(columns):
+            self._plot_signal(axes[i], col, cfg.COLORS[i], lines[i])
+        for ax in axes:
+            ax.relim()
+        for ax in axes:
+            ax.autoscale_view()
+        self.timings["signals"] = time.perf_counter() - start
 
+        start = time.perf_counter()
+        for i, col in enumerate(columns):
             if col in self.signals_to_plot_widths:
-                for x1, x2, width in self.pulse_points_width[col]:
-                    self._plot_pulse_width(axes[i], x1, x2, width)
+                if cfg.ANNOTATION_ENGINE == "batched":
+                    self._plot_pulse_widths(axes[i], self.pulse_points_width[col])
+                else:
+                    for x1, x2, width in self.pulse_points_width[col]:
+                        self._plot_pulse_width(axes[i], x1, x2, width)
+        self.timings["pulse widths"] = time.perf_counter() - start
 
+        start = time.perf_counter()
         for ax in axes:
             ax.grid(cfg.SHOW_GRID)
 
-            for vline in self.vlines:
-                self._plot_vertical_lines(ax, vline)
+            if cfg.ANNOTATION_ENGINE == "batched":
+                self._plot_vertical_lines_batch(ax, self.vlines)
+            else:
+                for vline in self.vlines:
+                    self._plot_vertical_lines(ax, vline)
+        self.timings["vlines"] = time.perf_counter() - start
+
+        self.logger.debug(
+            "Figure built: %s",
+            ", ".join(f"{name} {sec:.3f} s" for name, sec in self.timings.items()),
+        )
+
+        self.figure = fig
+
+    @staticmethod
+    def create_figure(columns: list, pyplot: bool = False) -> tuple:
+        """
+        Create an A4 figure with one axes per channel.
+
+        :param columns: Channel names, set as axes labels.
+        :param pyplot: Create the figure with pyplot, which keeps it open
+            until closed with ``plt.close()``.
+        :return: Figure and array of axes.
+        """
+        # Set A4 canvas size in inches
+        a4_width_inches = 8.27
+        a4_height_inches = 11.69
+        figsize = (a4_width_inches, a4_height_inches * 0.85)
+        bot_mrg = 1 - len(columns) / 10 if len(columns) < 10 else 0.1
 
+        fig = plt.figure(figsize=figsize) if pyplot else pltfg.Figure(figsize=figsize)
+        axes = fig.subplots(len(columns), 1, sharex="col", squeeze=False)[:, 0]
         fig.subplots_adjust(
             left=0.12, right=0.95, bottom=bot_mrg, top=0.95, wspace=0.4, hspace=0.4
         )
-        plt.xlabel("Time (ms)")
+        for ax, col in zip(axes, columns):
+            ax.set_ylabel(col)
+        axes[-1].set_xlabel("Time (ms)")
+        ms_per_sample = SignalProcessor.ms_per_sample()
+        if ms_per_sample != 1:
+            # Samples are plotted at their index, ticks are labelled in ms
+            axes[-1].xaxis.set_major_formatter(
+                FuncFormatter(lambda x, _: f"{x * ms_per_sample:.4g}")
+            )
+        return fig, axes
 
-        self.figure = fig
+    def close(self) -> None:
+        """Close the figure, or return it to the figure pool for next reports."""
+        if self.figure is None:
+            return
+        if self._pooled is not None:
+            FigurePool.release(self._pooled)
+            self._pooled = None
+        else:
+            plt.close(self.figure)
+        self.figure = None
+
+    def _plot_signal(
+        self, ax: plt.Axes, col: str, color: str, line: lines.Line2D = None
+    ) -> None:
+        """
+        Plot signal with the configured render engine, updating the data of
+        a pooled signal line if given.
+        """
+        if cfg.RENDER_ENGINE == "samples":
+            x, y = self.filtered_signals_df.index, self.filtered_signals_df[col]
+            drawstyle, snap = "steps-pre", None
+        else:
+            # Decimate only when there are more edges than the axes can show
+            bins = int(ax.get_window_extent().width * cfg.RENDER_BINS_PER_PIXEL)
+            if cfg.RENDER_ENGINE == "minmax" and len(self.filtered_edges[col]) > bins:
+                x, y = self.filtered_edges.minmax_points(col, bins)
+                drawstyle = "steps-post"
+            else:
+                x, y = self.filtered_edges.step_points(col)
+                drawstyle = "steps-pre"
+            # Short paths are pixel snapped by default, long sample paths are not
+            snap = False
+
+        if self.x_offset:
+            x = x + self.x_offset
+
+        if line is None:
+            (line,) = ax.plot(x, y, color, drawstyle=drawstyle, snap=snap)
+        else:
+            line.set_data(x, y)
+            line.set_drawstyle(drawstyle)
+            line.set_snap(snap)
+        # Dense traces are embedded as images, axes and annotations stay vectors
+        line.set_rasterized(cfg.RASTER_TRACES)
+
+    @property
+    def filtered_signals_df(self) -> pd.DataFrame:
+        """Filtered signals expanded to samples."""
+        if self._filtered_signals_df is None:
+            self._filtered_signals_df = self.filtered_edges.to_dataframe()
+        return self._filtered_signals_df
 
     def _plot_pulse_width(self, ax: plt.Axes, x1: int, x2: int, width: int) -> None:
         """Plot pulse width."""
@@ -97,7 +213,82 @@ class SignalGrapher:
             arrowprops={"arrowstyle": "<->", "color": cfg.CLR_DICT["gray"]},
         )
         ax.text(
-            (x1 + x2) / 2, 0.6, f"{width} ms", ha="center", color=cfg.CLR_DICT["gray"]
+            (x1 + x2) / 2,
+            0.6,
+            f"{width * self.ms_per_sample:.4g} ms",
+            ha="center",
+            color=cfg.CLR_DICT["gray"],
+        )
+
+    def _plot_pulse_widths(self, ax: plt.Axes, points_width: np.ndarray) -> None:
+        """
+        Plot pulse widths of a signal with a few batched artists: one line
+        collection, one marker set per arrow direction, and only the labels
+        that do not overlap their neighbours.
+        """
+        if not len(points_width):
+            return
+        x1, x2, width = np.asarray(points_width).T
+        color = cfg.CLR_DICT["gray"]
+        y = np.full(len(x1), 0.5)
+
+        ax.add_collection(
+            LineCollection(
+                np.stack((np.column_stack((x1, y)), np.column_stack((x2, y))), axis=1),
+                colors=color,
+            ),
+            autolim=False,
+        )
+        ax.plot(
+            x1, y, color=color, linestyle="", marker=markers.CARETLEFT, markersize=4
+        )
+        ax.plot(
+            x2, y, color=color, linestyle="", marker=markers.CARETRIGHT, markersize=4
+        )
+
+        labels = np.char.mod("%.4g ms", width * self.ms_per_sample)
+        for i in self._visible_labels(ax, (x1 + x2) / 2, labels):
+            ax.text(
+                (x1[i] + x2[i]) / 2,
+                0.6,
+                labels[i],
+                ha="center",
+                color=color,
+            )
+
+    @staticmethod
+    def _visible_labels(ax: plt.Axes, centers: np.ndarray, labels: np.ndarray) -> list:
+        """
+        Indices of pulse width labels that fit without overlapping, taken
+        left to right. Label extents are estimated from the font size.
+        """
+        ax.get_xlim()  # Apply pending autoscaling to transData
+        pixels = ax.transData.transform(
+            np.column_stack((centers, np.zeros_like(centers)))
+        )[:, 0]
+        char_width = plt.rcParams["font.size"] * 0.6 * ax.figure.dpi / 72
+        half_extents = np.char.str_len(labels) * char_width / 2
+
+        visible = []
+        right_edge = -np.inf
+        for i in np.argsort(pixels, kind="stable"):
+            if pixels[i] - half_extents[i] >= right_edge + cfg.LABEL_SPACING:
+                visible.append(int(i))
+                right_edge = pixels[i] + half_extents[i]
+        return visible
+
+    def _plot_vertical_lines_batch(self, ax: plt.Axes, vlines: list) -> None:
+        """Plot all vertical dashed lines of an axes as one collection."""
+        if not vlines:
+            return
+        ax.add_collection(
+            LineCollection(
+                [((x, 0), (x, 1)) for x in vlines],
+                colors=cfg.CLR_DICT["purple"],
+                linestyles="--",
+                transform=ax.get_xaxis_transform(),
+            ),
+            autolim=False,
         )
 
     def _plot_vertical_lines(self, ax: plt.Axes, vline_x: int) -> None:
@@ -117,3 +308,69 @@ class SignalGrapher:
     def add_vlines(self, vlines: list) -> None:
         """Add vertical dashed lines."""
         self.vlines = vlines
+
+
+class PooledFigure(NamedTuple):
+    """Figure of the figure pool with its axes and signal lines."""
+
+    key: tuple
+    figure: pltfg.Figure
+    axes: np.ndarray
+    lines: list
+
+
+class FigurePool:
+    """
+    Class to reuse report figures.
+
+    Figures are built off pyplot once per channel configuration, with their
+    axes layout, labels and one signal line per axes. A report only sets
+    the line data, adds its annotations and rescales the axes; releasing
+    the figure removes the annotations again. Figures are never registered
+    with pyplot, so nothing accumulates over a long-running service.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    # Idle figures kept, least recently used are dropped first
+    MAX_FIGURES = 4
+
+    _idle: OrderedDict = OrderedDict()
+
+    @classmethod
+    def acquire(cls, columns: list) -> PooledFigure:
+        """Take an idle figure for the channels or build a new one."""
+        key = cls._key(columns)
+        if key in cls._idle and cls._idle[key]:
+            cls._idle.move_to_end(key)
+            return cls._idle[key].pop()
+
+        fig, axes = SignalGrapher.create_figure(columns)
+        signal_lines = [
+            ax.plot([], [], color)[0] for ax, color in zip(axes, cfg.COLORS)
+        ]
+        cls.logger.debug("Figure built for %d channels", len(columns))
+        return PooledFigure(key, fig, axes, signal_lines)
+
+    @classmethod
+    def release(cls, pooled: PooledFigure) -> None:
+        """Remove annotations of a report and keep the figure for reuse."""
+        keep = set(pooled.lines)
+        for ax in pooled.axes:
+            for artist in [*ax.lines, *ax.collections, *ax.texts, *ax.patches]:
+                if artist not in keep:
+                    artist.remove()
+            ax.set_prop_cycle(None)
+
+        cls._idle.setdefault(pooled.key, []).append(pooled)
+        cls._idle.move_to_end(pooled.key)
+        while sum(len(idle) for idle in cls._idle.values()) > cls.MAX_FIGURES:
+            oldest = next(iter(cls._idle))
+            cls._idle[oldest].pop(0)
+            if not cls._idle[oldest]:
+                del cls._idle[oldest]
+
+    @staticmethod
+    def _key(columns: list) -> tuple:
+        """Pool key of figures: channels and the settings set on building."""
+        return tuple(columns), tuple(cfg.COLORS)
@@ -8,12 +8,27 @@
 
 # This file is part of the analyzer_reporter project
 
+from typing import Iterable, Union
+
 import pandas as pd
 import numpy as np
 from scipy import signal
+from numpy.lib.recfunctions import structured_to_unstructured
 
 from config import Configuration as cfg
 from logger import get_cls_logger
+from run_metrics import RunMetrics
+from signal_edges import SignalEdges
+from replay_source import ReplaySource
+from capture_parser import command_sample_rate, parse_sample_rate
+
+# Pulse table record: channel index, pulse start and end pivots, width
+PULSE_DTYPE = np.dtype(
+    [("channel", np.int16), ("x1", np.int64), ("x2", np.int64), ("width", np.int64)]
+)
+
+# Interval between two consecutive edges of a channel and its level
+RUN_DTYPE = np.dtype(PULSE_DTYPE.descr + [("level", np.int8)])
 
 
 class SignalProcessor:
@@ -21,98 +36,508 @@ class SignalProcessor:
 
     logger = get_cls_logger(__qualname__)
 
-    def __init__(self, signals_df: pd.DataFrame):
+    def __init__(
+        self, signals_df: Union[pd.DataFrame, np.ndarray], channels: list = None
+    ):
+        """
+        Initialize SignalProcessor.
+
+        :param signals_df: DataFrame of signals or a (samples, channels) matrix.
+        :param channels: Channel names of the matrix columns.
+        """
+        if isinstance(signals_df, np.ndarray):
+            signals_df = pd.DataFrame(signals_df, columns=channels, copy=False)
         self.signals_df = signals_df
 
+        # Edge list (run-length) representation of the raw signals
+        with RunMetrics.stage("edges"):
+            self.signal_edges = SignalEdges.from_dataframe(signals_df)
+
         # Filter noise for each signal
-        self.filtered_signals_df = self._filter_noise()
+        with RunMetrics.stage("filter"):
+            self.filtered_edges = self._filter_noise(signals_df, self.signal_edges)
+
+        # Extract pulses of all signals at once
+        with RunMetrics.stage("pulses"):
+            self._set_pulses(
+                *self._extract_pulses(self.filtered_edges),
+                self._count_glitches(self.signal_edges, self.filtered_edges),
+            )
+
+        self.logger.debug("Initialized %s", self.__class__.__name__)
+
+    @classmethod
+    def from_results(
+        cls,
+        signals_df: pd.DataFrame,
+        filtered_edges: SignalEdges,
+        pulse_table: np.ndarray,
+        rising: np.ndarray,
+        glitches: np.ndarray,
+    ) -> "SignalProcessor":
+        """
+        Restore a processor from saved processing results without filtering
+        and extracting pulses again. Raw signal edges are not restored.
+        """
+        processor = cls.__new__(cls)
+        processor.signals_df = signals_df
+        processor.signal_edges = None
+        processor.filtered_edges = filtered_edges
+        processor._set_pulses(pulse_table, rising, glitches)
+        return processor
 
-        # Find pulse pivots for each signal
-        self.pulse_pivots_df = self._find_pulse_pivots()
+    @classmethod
+    def from_windows(
+        cls, windows: Iterable, columns: list, length: int
+    ) -> "SignalProcessor":
+        """
+        Process signals given as successive overlapping windows, e.g. of a
+        memory-mapped replay source, holding only one window of samples at
+        a time. Results are identical to processing all samples at once.
+
+        :param windows: Iterable of (start, stop, offset, samples) tuples:
+            a (samples, channels) matrix starting at sample ``offset`` that
+            covers the samples ``start`` to ``stop`` of the signals and at
+            least FILTER_WSIZE more samples on both sides, where available.
+        :param columns: Channel names.
+        :param length: Total number of samples.
+        """
+        raw_edges, filtered_edges = [], []
+        for start, stop, offset, samples in windows:
+            window_df = pd.DataFrame(samples, columns=columns, copy=False)
+            edges = SignalEdges.from_dataframe(window_df)
+            for window_edges, found in (
+                (edges, raw_edges),
+                (cls._filter_noise(window_df, edges), filtered_edges),
+            ):
+                found.append(window_edges.crop(start - offset, stop - offset, offset))
+
+        processor = cls.__new__(cls)
+        processor.signals_df = None
+        processor.signal_edges = SignalEdges.concatenate(raw_edges, length)
+        processor.filtered_edges = SignalEdges.concatenate(filtered_edges, length)
+        processor._set_pulses(
+            *cls._extract_pulses(processor.filtered_edges),
+            cls._count_glitches(processor.signal_edges, processor.filtered_edges),
+        )
+        return processor
+
+    @classmethod
+    def from_replay_source(cls, source: ReplaySource) -> "SignalProcessor":
+        """
+        Process a memory-mapped replay source window by window, in windows of
+        REPLAY_CHUNK_SIZE samples overlapping by FILTER_WSIZE samples.
+        """
+        return cls.from_windows(
+            source.windows(cfg.REPLAY_CHUNK_SIZE, cfg.FILTER_WSIZE),
+            source.columns,
+            len(source),
+        )
+
+    def _set_pulses(
+        self, pulse_table: np.ndarray, rising: np.ndarray, glitches: np.ndarray
+    ) -> None:
+        """Set the pulse table and pulse metrics derived from it."""
+        self.pulse_table = pulse_table
+        self.rising = rising
+        self.glitches = glitches
 
         # Calculate pulse count and pulse width for each signal
         self.pulse_count, self.pulse_points_width = self._calculate_pulse_metrics()
+        self.pulse_stats = self._calculate_pulse_stats()
 
         self.rising_signals = self._determine_rising_signals()
 
-        self.logger.debug("Initialized %s", self.__class__.__name__)
+        self._filtered_signals_df = None
+
+    @classmethod
+    def _filter_noise(
+        cls, signals_df: pd.DataFrame, signal_edges: SignalEdges
+    ) -> SignalEdges:
+        """Filter noise for each signal with the configured filter engine."""
+        if cfg.FILTER_ENGINE == "edges":
+            return signal_edges.median_filter(cfg.FILTER_WSIZE)
+
+        if cfg.FILTER_ENGINE == "majority":
+            filtered = cls._majority_filter(signals_df.to_numpy(), cfg.FILTER_WSIZE)
+        else:
+            filtered = signals_df.apply(
+                lambda col: signal.medfilt(col, cfg.FILTER_WSIZE)
+            ).to_numpy()
+        return SignalEdges.from_matrix(filtered, list(signals_df.columns))
+
+    @staticmethod
+    def _majority_filter(matrix: np.ndarray, wsize: int) -> np.ndarray:
+        """
+        Median filter binary signals of all channels at once.
+        The median of 0/1 samples is a majority vote over the window, so a
+        sliding count from one cumulative sum gives ``signal.medfilt``
+        results (with its zero padding) in O(n).
+        """
+        half = wsize // 2
+        length = matrix.shape[0]
+        # Channel-major layout keeps every running count contiguous
+        channels = np.ascontiguousarray(matrix.T)
 
-    def _filter_noise(self) -> pd.DataFrame:
-        """Filter noise for each signal."""
-        return self.signals_df.apply(lambda col: signal.medfilt(col, cfg.FILTER_WSIZE))
+        # Counts of ones before each sample, padded with the zero padding
+        # counts on the left and the total count on the right
+        counts = np.zeros((channels.shape[0], length + 2 * half + 1), dtype=np.int32)
+        np.cumsum(channels, axis=1, out=counts[:, half + 1 : length + half + 1])
+        counts[:, length + half + 1 :] = counts[:, length + half : length + half + 1]
 
-    def _find_pulse_pivots(self) -> pd.DataFrame:
-        """Find pulse pivots for each signal."""
-        return self.filtered_signals_df.apply(np.diff)
+        window_sum = counts[:, 2 * half + 1 :] - counts[:, :length]
+        return (window_sum > half).view(np.int8).T
 
     def _calculate_pulse_metrics(self) -> tuple:
         """Calculate pulse count and pulse width for each signal."""
-        pulse_count = {}
-        pulse_points_width = {}
-        for col in self.pulse_pivots_df.columns:
-            pulse_points_width[col] = self._signal_pulse_points_width(
-                self.pulse_pivots_df[col]
-            )
-            pulse_count[col] = len(pulse_points_width[col])
+        columns = self.filtered_edges.columns
+        bounds = np.searchsorted(
+            self.pulse_table["channel"], np.arange(len(columns) + 1)
+        )
+        points_width = structured_to_unstructured(
+            self.pulse_table[["x1", "x2", "width"]]
+        )
 
+        pulse_count = dict(zip(columns, np.diff(bounds).tolist()))
+        pulse_points_width = {
+            col: points_width[bounds[i] : bounds[i + 1]]
+            for i, col in enumerate(columns)
+        }
         return pulse_count, pulse_points_width
 
+    def _calculate_pulse_stats(self) -> pd.DataFrame:
+        """
+        Calculate pulse statistics of all signals at once from the pulse
+        table, without another pass over the samples.
+
+        :return: DataFrame indexed by channel: pulse count, period in ms and
+            frequency in Hz of pulse starts, duty cycle (pulse time over the
+            periods), min, max, mean and standard deviation of pulse widths
+            in ms, and the number of glitches removed by the noise filter.
+            Undefined values, e.g. the period of a single pulse, are NaN.
+            Times are converted from samples at the sample rate of
+            CAPTURE_COMMAND.
+        """
+        sample_rate = self._sample_rate()
+        ms_per_sample = self.ms_per_sample()
+        columns = self.filtered_edges.columns
+        channel = self.pulse_table["channel"]
+        width = self.pulse_table["width"].astype(np.float64)
+        bounds = np.searchsorted(channel, np.arange(len(columns) + 1))
+        count = np.diff(bounds)
+        present = count > 0
+        first, last = bounds[:-1][present], bounds[1:][present] - 1
+
+        width_min = np.full(len(columns), np.nan)
+        width_max = np.full(len(columns), np.nan)
+        # Pulses are sorted by channel, so nonempty channels are consecutive
+        width_min[present] = np.minimum.reduceat(width, first)
+        width_max[present] = np.maximum.reduceat(width, first)
+        width_sum = np.bincount(channel, weights=width, minlength=len(columns))
+
+        # Periods between the first and the last pulse start
+        span = np.zeros(len(columns))
+        span[present] = self.pulse_table["x1"][last] - self.pulse_table["x1"][first]
+        last_width = np.zeros(len(columns))
+        last_width[present] = width[last]
+
+        with np.errstate(divide="ignore", invalid="ignore"):
+            width_mean = width_sum / count
+            width_std = np.sqrt(
+                np.bincount(
+                    channel,
+                    weights=(width - width_mean[channel]) ** 2,
+                    minlength=len(columns),
+                )
+                / count
+            )
+            period = np.where(count > 1, span / (count - 1), np.nan)
+            duty_cycle = np.where(span > 0, (width_sum - last_width) / span, np.nan)
+            frequency = sample_rate / period
+
+        return pd.DataFrame(
+            {
+                "pulses": count,
+                "period": period * ms_per_sample,
+                "frequency": frequency,
+                "duty_cycle": duty_cycle,
+                "width_min": width_min * ms_per_sample,
+                "width_max": width_max * ms_per_sample,
+                "width_mean": width_mean * ms_per_sample,
+                "width_std": width_std * ms_per_sample,
+                "glitches": self.glitches,
+            },
+            index=pd.Index(columns, name="channel"),
+        )
+
+    @classmethod
+    def _sample_rate(cls) -> float:
+        """Sample rate in Hz of CAPTURE_COMMAND, 1 kHz if it is not set."""
+        rate = command_sample_rate(cfg.CAPTURE_COMMAND)
+        if rate is None:
+            return 1000.0
+        try:
+            return parse_sample_rate(rate)
+        except ValueError as e:
+            cls.logger.warning("%s, 1 kHz assumed", e)
+            return 1000.0
+
+    @classmethod
+    def ms_per_sample(cls) -> float:
+        """Duration of a sample in ms at the sample rate of CAPTURE_COMMAND."""
+        return 1000 / cls._sample_rate()
+
+    @staticmethod
+    def _count_glitches(
+        signal_edges: SignalEdges, filtered_edges: SignalEdges
+    ) -> np.ndarray:
+        """
+        Count glitches removed by the noise filter for each signal: every
+        removed glitch takes out a pair of edges.
+        """
+        removed = np.diff(signal_edges.offsets) - np.diff(filtered_edges.offsets)
+        return np.maximum(removed, 0) // 2
+
     def _determine_rising_signals(self) -> dict:
         """Determine rising signals."""
-        return {
-            col: self._is_rising_signal(self.pulse_pivots_df[col])
-            for col in self.pulse_pivots_df.columns
-        }
+        return dict(zip(self.filtered_edges.columns, self.rising.tolist()))
 
     @staticmethod
-    def _is_start_from_pulse(sig_pivots: pd.Series) -> bool:
-        """Function to check if signal is start from pulse."""
-        all_indices = np.atleast_1d(sig_pivots).nonzero()[0]
-        differences = np.diff(all_indices)
-        return np.sum(differences[::2]) < np.sum(differences[1::2])
+    def _extract_pulses(edges: SignalEdges) -> tuple:
+        """
+        Extract pulses of all channels in one vectorized pass over edge lists.
 
-    @staticmethod
-    def _signal_pulse_points_width(sig_pivots: pd.Series) -> list:
-        """Function to calculate pulses points and width."""
-        all_indices = np.atleast_1d(sig_pivots).nonzero()[0]
-        differences = np.diff(all_indices)
-        if SignalProcessor._is_start_from_pulse(sig_pivots):
-            pulses_points, pulses_width = all_indices[:], differences[::2]
-        else:
-            pulses_points, pulses_width = all_indices[1:], differences[1::2]
+        A channel starts from a pulse when the intervals after its even edges
+        are shorter in total than the intervals after its odd edges. Pulses
+        are then the intervals between consecutive edge pairs of that parity,
+        and the signal is rising when its pulses are high.
 
-        # Ensure even number of pulse points
-        if len(pulses_points) % 2 != 0:
-            pulses_points = pulses_points[:-1]
+        :return: Structured array of pulses (channel, x1, x2, width) sorted by
+            channel and x1, and a boolean array of rising channels.
+        """
+        pivots = edges.positions - 1
+        edge_counts = np.diff(edges.offsets)
+        channel = np.repeat(np.arange(len(edge_counts)), edge_counts)
+        rank = np.arange(len(pivots)) - edges.offsets[channel]
 
-        pulses_points = np.split(pulses_points, len(pulses_points) // 2)
+        # Intervals between consecutive edges of the same channel
+        differences = np.diff(pivots)
+        same_channel = channel[1:] == channel[:-1]
+        is_even = rank[:-1] % 2 == 0
+        even_sum = np.bincount(
+            channel[:-1][same_channel & is_even],
+            weights=differences[same_channel & is_even],
+            minlength=len(edge_counts),
+        )
+        odd_sum = np.bincount(
+            channel[:-1][same_channel & ~is_even],
+            weights=differences[same_channel & ~is_even],
+            minlength=len(edge_counts),
+        )
+        start_from_pulse = even_sum < odd_sum
 
-        return [
-            np.append(_point, _width)
-            for _point, _width in zip(pulses_points, pulses_width)
-        ]
+        pulse_parity = np.where(start_from_pulse, 0, 1)
+        starts = np.flatnonzero(
+            (rank % 2 == pulse_parity[channel]) & (rank + 1 < edge_counts[channel])
+        )
 
-    @staticmethod
-    def _is_rising_signal(_signal: pd.Series) -> bool:
-        """Function to check if signal is rising."""
-        all_indices = np.atleast_1d(_signal).nonzero()[0]
-        rising_edges = np.where(np.atleast_1d(_signal) == 1)[0]
-        first_edge_is_rising = all_indices[0] == rising_edges[0]
+        pulse_table = np.empty(len(starts), dtype=PULSE_DTYPE)
+        pulse_table["channel"] = channel[starts]
+        pulse_table["x1"] = pivots[starts]
+        pulse_table["x2"] = pivots[starts + 1]
+        pulse_table["width"] = pulse_table["x2"] - pulse_table["x1"]
 
-        if SignalProcessor._is_start_from_pulse(_signal):
-            return first_edge_is_rising
-        return not first_edge_is_rising
+        first_edge_is_rising = edges.initial == 0
+        rising = (start_from_pulse == first_edge_is_rising) & (edge_counts > 0)
+        return pulse_table, rising
+
+    @property
+    def filtered_signals_df(self) -> pd.DataFrame:
+        """Property to access filtered signals expanded to samples."""
+        if self._filtered_signals_df is None:
+            self._filtered_signals_df = self.filtered_edges.to_dataframe()
+            if self.signals_df is not None:
+                self._filtered_signals_df.index = self.signals_df.index
+        return self._filtered_signals_df
+
+    @property
+    def pulse_pivots_df(self) -> pd.DataFrame:
+        """Property to access pulse pivots expanded to samples."""
+        pivots = np.zeros(
+            (max(self.filtered_edges.length - 1, 0), len(self.filtered_edges.columns)),
+            dtype=np.int8,
+        )
+        for i, col in enumerate(self.filtered_edges.columns):
+            pivots[self.filtered_edges.pivots(col), i] = np.where(
+                self.filtered_edges.levels(col), 1, -1
+            )
+        return pd.DataFrame(pivots, columns=self.filtered_edges.columns)
 
     @property
     def pulse_points(self) -> dict:
         """Property to access pulse points (X1, X2)."""
-        return {
-            k: list(map(lambda x: x[:2], v)) for k, v in self.pulse_points_width.items()
-        }
+        return {k: list(v[:, :2]) for k, v in self.pulse_points_width.items()}
 
     @property
     def pulse_width(self) -> dict:
-        """Property to access pulse width."""
+        """Property to access pulse width in ms."""
+        ms_per_sample = self.ms_per_sample()
         return {
-            k: list(map(lambda x: x[2], v)) for k, v in self.pulse_points_width.items()
+            k: (v[:, 2] * ms_per_sample).tolist()
+            for k, v in self.pulse_points_width.items()
         }
+
+
+class StreamingSignalProcessor:
+    """
+    Class to process signals incrementally, block by block.
+
+    Only the raw samples the median filter still needs are kept between
+    blocks, plus the last edge and running interval totals of each channel,
+    so memory does not grow with the capture length. Every interval between
+    two edges is emitted as soon as the filtered signal closes it.
+
+    Pulses are the intervals of the level with the shorter total duration,
+    as in SignalProcessor, so the pulse level of a channel may change while
+    the capture goes on. Emitted intervals carry their level and the current
+    pulse level is given by rising_signals; after finish() the intervals of
+    that level are exactly the pulses found by SignalProcessor.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    def __init__(self, columns: list):
+        """
+        Initialize StreamingSignalProcessor.
+
+        :param columns: Channel names.
+        """
+        self.columns = list(columns)
+        self.samples = 0
+        # Filtered level of each channel at the first sample
+        self.initial: np.ndarray = None
+
+        # Raw samples from buffer_start on that the filter still needs
+        self._buffer = np.empty((0, len(self.columns)), dtype=np.int8)
+        self._buffer_start = 0
+        # First sample without a filtered level yet
+        self._next = 0
+
+        # Last edge pivot of each channel and the level after it
+        self._last_pivot = np.zeros(len(self.columns), dtype=np.int64)
+        self._last_level = np.zeros(len(self.columns), dtype=np.int8)
+        self.edge_counts = np.zeros(len(self.columns), dtype=np.int64)
+        # Closed interval counts and total widths by level (low, high)
+        self._run_counts = np.zeros((len(self.columns), 2), dtype=np.int64)
+        self._run_widths = np.zeros((len(self.columns), 2), dtype=np.int64)
+
+        self.logger.debug("Initialized %s", self.__class__.__name__)
+
+    def feed(self, block: Union[pd.DataFrame, np.ndarray]) -> np.ndarray:
+        """
+        Process the next block of samples.
+
+        :param block: DataFrame of signals or a (samples, channels) matrix.
+        :return: Intervals closed by the block, RUN_DTYPE records sorted by
+            channel and x1.
+        """
+        block = np.asarray(block, dtype=np.int8).reshape(-1, len(self.columns))
+        self._buffer = np.concatenate((self._buffer, block))
+        self.samples += len(block)
+        # Filtered levels of the last half window depend on the next block
+        return self._process(self.samples - cfg.FILTER_WSIZE // 2)
+
+    def finish(self) -> np.ndarray:
+        """
+        Process the samples held back for the filter, zero padded after the
+        last sample like the whole capture would be.
+
+        :return: Intervals closed by the end of the capture.
+        """
+        return self._process(self.samples)
+
+    @property
+    def rising(self) -> np.ndarray:
+        """
+        Boolean array of rising channels: pulses are high when the high
+        intervals are shorter in total, ties settled like SignalProcessor.
+        """
+        low, high = self._run_widths.T
+        first_edge_is_rising = self._last_level == (self.edge_counts % 2)
+        return np.where(first_edge_is_rising, high < low, high <= low) & (
+            self.edge_counts > 0
+        )
+
+    @property
+    def rising_signals(self) -> dict:
+        """Property to access running rising flags of signals."""
+        return dict(zip(self.columns, self.rising.tolist()))
+
+    @property
+    def pulse_count(self) -> dict:
+        """Property to access running pulse counts of signals."""
+        pulse_count = self._run_counts[np.arange(len(self.columns)), self.rising * 1]
+        return dict(zip(self.columns, pulse_count.tolist()))
+
+    def _process(self, stop: int) -> np.ndarray:
+        """Filter the buffered samples up to stop and close intervals."""
+        if stop <= self._next:
+            return np.empty(0, dtype=RUN_DTYPE)
+
+        window_df = pd.DataFrame(self._buffer, columns=self.columns, copy=False)
+        filtered_edges = SignalProcessor._filter_noise(
+            window_df, SignalEdges.from_dataframe(window_df)
+        ).crop(
+            self._next - self._buffer_start,
+            stop - self._buffer_start,
+            self._buffer_start,
+        )
+        if self.initial is None:
+            self.initial = filtered_edges.initial.copy()
+            self._last_level[:] = self.initial
+        self._next = stop
+
+        # The level before the next sample needs half a window more
+        keep = max(self._next - cfg.FILTER_WSIZE // 2 - 1, 0)
+        self._buffer = self._buffer[keep - self._buffer_start :]
+        self._buffer_start = keep
+
+        runs = self._close_runs(filtered_edges)
+        self.logger.debug(
+            "Processed %d samples, pulse count: %s", self._next, self.pulse_count
+        )
+        return runs
+
+    def _close_runs(self, edges: SignalEdges) -> np.ndarray:
+        """Close intervals between the last and the new edges of each channel."""
+        runs = []
+        for i, col in enumerate(self.columns):
+            pivots = edges.pivots(col)
+            if not len(pivots):
+                continue
+            if self.edge_counts[i]:
+                pivots = np.concatenate(([self._last_pivot[i]], pivots))
+                first_level = self._last_level[i]
+            else:
+                first_level = 1 - self._last_level[i]
+
+            channel_runs = np.empty(len(pivots) - 1, dtype=RUN_DTYPE)
+            channel_runs["channel"] = i
+            channel_runs["x1"] = pivots[:-1]
+            channel_runs["x2"] = pivots[1:]
+            channel_runs["width"] = np.diff(pivots)
+            channel_runs["level"] = (first_level + np.arange(len(pivots) - 1)) % 2
+            runs.append(channel_runs)
+
+            new_edges = len(pivots) - (self.edge_counts[i] > 0)
+            self._run_counts[i] += np.bincount(channel_runs["level"], minlength=2)
+            self._run_widths[i] += np.bincount(
+                channel_runs["level"], weights=channel_runs["width"], minlength=2
+            ).astype(np.int64)
+            self.edge_counts[i] += new_edges
+            self._last_pivot[i] = pivots[-1]
+            self._last_level[i] = (self._last_level[i] + new_edges) % 2
+
+        if not runs:
+            return np.empty(0, dtype=RUN_DTYPE)
+        return np.concatenate(runs)
@@ -9,6 +9,8 @@
 # This file is part of the analyzer_reporter project
 
 import os
+import json
+import threading
 
 from config import Configuration as cfg
 from logger import get_cls_logger
@@ -19,6 +21,11 @@ class StorageController:
 
     logger = get_cls_logger(__qualname__)
 
+    REPORT_INDEX_KEYS = ("last_pdf_report", "pdf_count", "data_dir_mtime_ns")
+
+    # The main thread and the report pipeline writer share the index file
+    _index_lock = threading.Lock()
+
     def __init__(self):
         self.logger.debug("Initialized %s", self.__class__.__name__)
         self.usb_plugged = self.check_usb_plugged()
@@ -26,6 +33,7 @@ class StorageController:
         self.mount_point = None
         self.data_dir = None
         self.pdf_files = []
+        self.pdf_count = 0
         self.last_pdf_report = None
         self.last_pdf_report_date = None
         self.last_pdf_report_idx = 0
@@ -33,6 +41,7 @@ class StorageController:
         self.current_pdf_report_idx = 0
         self.free_space = 0
         self.ready_to_write = False
+        self.reserved_pdf_report_idx = 0
         self.update()
 
     def update(self) -> None:
@@ -44,8 +53,7 @@ class StorageController:
 
             if self.usb_mounted:
                 self._create_data_directory()
-                self.get_pdf_files()
-                self.get_last_pdf_report()
+                self.load_report_index()
                 self.get_last_pdf_report_date()
                 self.get_last_pdf_report_idx()
                 self._set_current_pdf_report()
@@ -61,6 +69,7 @@ class StorageController:
         self.mount_point = None
         self.data_dir = None
         self.pdf_files = []
+        self.pdf_count = 0
         self.last_pdf_report = None
         self.last_pdf_report_date = None
         self.last_pdf_report_idx = 0
@@ -84,6 +93,87 @@ class StorageController:
         if not os.path.exists(self.data_dir):
             os.mkdir(self.data_dir)
 
+    @property
+    def report_index_file(self) -> str:
+        """Path of the report index file in the USB drive root."""
+        return os.path.join(self.mount_point, cfg.REPORT_INDEX_FILE)
+
+    def load_report_index(self) -> None:
+        """Get the last PDF report and PDF count from the report index."""
+        with self._index_lock:
+            index = self._read_report_index(self.report_index_file)
+            if index is None or index["data_dir_mtime_ns"] != self._mtime(
+                self.data_dir
+            ):
+                index = self.rebuild_report_index()
+        self.last_pdf_report = index["last_pdf_report"]
+        self.pdf_count = index["pdf_count"]
+
+    def rebuild_report_index(self) -> dict:
+        """Scan the data directory and save a new report index."""
+        self.get_pdf_files()
+        self.get_last_pdf_report()
+        index = {
+            "last_pdf_report": self.last_pdf_report,
+            "pdf_count": len(self.pdf_files),
+        }
+        self._write_report_index(index, self.report_index_file, self.data_dir)
+        self.logger.debug("Report index rebuilt: %s", index)
+        return index
+
+    def record_report(self, report_file: str) -> None:
+        """
+        Add a just written PDF report to the report index. Called right after
+        writing the report files, so the index stays valid without a rescan.
+        Paths are taken from the report file, as it may run in the pipeline
+        writer thread while the main thread updates the instance.
+        """
+        data_dir, name = os.path.split(report_file)
+        index_file = os.path.join(os.path.dirname(data_dir), cfg.REPORT_INDEX_FILE)
+        with self._index_lock:
+            index = self._read_report_index(index_file)
+            if index is None or name <= (index["last_pdf_report"] or ""):
+                # Left stale, the next update rebuilds it
+                return
+            index["last_pdf_report"] = name
+            index["pdf_count"] += 1
+            self._write_report_index(index, index_file, data_dir)
+
+    def _read_report_index(self, index_file: str) -> dict:
+        """Read the report index, None if it is missing or damaged."""
+        try:
+            with open(index_file, "r", encoding="utf-8") as fp:
+                index = json.load(fp)
+            if index["data_dir"] != cfg.DATA_DIR_NAME:
+                return None
+            return {key: index[key] for key in self.REPORT_INDEX_KEYS}
+        except (OSError, ValueError, TypeError, KeyError) as e:
+            self.logger.debug("Report index not loaded: %s", e)
+            return None
+
+    def _write_report_index(self, index: dict, index_file: str, data_dir: str) -> None:
+        """
+        Save the report index stamped with the data directory mtime.
+        It is written to a temporary file and renamed over the old one,
+        so a crash or an unplugged drive leaves either version intact.
+        """
+        index["data_dir"] = cfg.DATA_DIR_NAME
+        index["data_dir_mtime_ns"] = self._mtime(data_dir)
+        tmp_file = index_file + ".tmp"
+        try:
+            with open(tmp_file, "w", encoding="utf-8") as fp:
+                json.dump(index, fp)
+                fp.flush()
+                os.fsync(fp.fileno())
+            os.replace(tmp_file, index_file)
+        except OSError as e:
+            self.logger.warning("Report index not saved: %s", e)
+
+    @staticmethod
+    def _mtime(path: str) -> int:
+        """Modification time of a path in nanoseconds."""
+        return os.stat(path).st_mtime_ns
+
     def get_pdf_files(self) -> None:
         """Get a list of PDF files in the data directory."""
         self.pdf_files = [
@@ -93,7 +183,7 @@ class StorageController:
     def get_last_pdf_report(self) -> None:
         """Get the last PDF report file."""
         if self.pdf_files:
-            self.last_pdf_report = sorted(self.pdf_files)[-1]
+            self.last_pdf_report = max(self.pdf_files)
 
     def get_last_pdf_report_date(self) -> None:
         """Extract the date from the last PDF report file."""
@@ -109,16 +199,29 @@ class StorageController:
 
     def _set_current_pdf_report(self) -> None:
         """Set the current PDF report file index and full path."""
-        self.current_pdf_report_idx = (
-            1
+        last_pdf_report_idx = (
+            0
             if cfg.CURRENT_DATE != self.last_pdf_report_date
-            else self.last_pdf_report_idx + 1
+            else self.last_pdf_report_idx
+        )
+        # Reports still being written in the background are not on disk yet
+        self.current_pdf_report_idx = (
+            max(last_pdf_report_idx, self.reserved_pdf_report_idx) + 1
         )
         self.current_pdf_report = os.path.join(
             self.data_dir,
             cfg.REPORT_NAME.format(IDX=str(self.current_pdf_report_idx).zfill(3)),
         )
 
+    def reserve_current_pdf_report(self) -> None:
+        """
+        Reserve the current PDF report index for a report that is still being
+        written in the background and move on to the next one.
+        """
+        self.reserved_pdf_report_idx = self.current_pdf_report_idx
+        if self.data_dir:
+            self._set_current_pdf_report()
+
     def get_free_space(self) -> None:
         """Get the free space in the USB drive."""
         statvfs: os.statvfs = os.statvfs(self.mount_point)
@@ -0,0 +1,7 @@
+# This file is part of the analyzer_reporter project
+
+import os
+import sys
+
+# Modules of the project are imported from the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import numpy as np
+import pytest
+from scipy import signal
+
+from signal_edges import SignalEdges
+from signal_processor import SignalProcessor
+
+WSIZES = [1, 3, 5, 7, 15, 31]
+
+
+def medfilt(matrix: np.ndarray, wsize: int) -> np.ndarray:
+    """Reference filter: scipy.signal.medfilt of every channel."""
+    return np.column_stack(
+        [signal.medfilt(col.astype(float), wsize) for col in matrix.T]
+    ).astype(np.int8)
+
+
+def edges_filter(matrix: np.ndarray, wsize: int) -> np.ndarray:
+    """Median filter on edge lists."""
+    columns = [f"ch{i}" for i in range(matrix.shape[1])]
+    return SignalEdges.from_matrix(matrix, columns).median_filter(wsize).to_matrix()
+
+
+def majority_filter(matrix: np.ndarray, wsize: int) -> np.ndarray:
+    """Median filter by sliding counts of ones."""
+    # pylint: disable=protected-access
+    return SignalProcessor._majority_filter(matrix, wsize)
+
+
+ENGINES = [edges_filter, majority_filter]
+
+
+def random_matrix(rng: np.random.Generator, length: int) -> np.ndarray:
+    """Random 0/1 channels of sparse, dense and bursty edges."""
+    channels = [
+        rng.integers(0, 2, length),
+        (rng.random(length) < 0.05).astype(int),
+        np.repeat(rng.integers(0, 2, length // 4 + 1), 4)[:length],
+    ]
+    return np.column_stack(channels).astype(np.int8)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("wsize", WSIZES)
+def test_random_signals(engine, wsize):
+    rng = np.random.default_rng(wsize)
+    for length in (50, 333, 2000):
+        matrix = random_matrix(rng, length)
+        np.testing.assert_array_equal(engine(matrix, wsize), medfilt(matrix, wsize))
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("wsize", WSIZES)
+def test_constant_signals(engine, wsize):
+    matrix = np.column_stack(
+        (np.zeros(100, dtype=np.int8), np.ones(100, dtype=np.int8))
+    )
+    np.testing.assert_array_equal(engine(matrix, wsize), medfilt(matrix, wsize))
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("wsize", WSIZES)
+def test_single_sample_pulses_at_ends(engine, wsize):
+    length = 64
+    high = np.zeros((length, 4), dtype=np.int8)
+    high[0, 0] = high[-1, 1] = 1
+    high[[0, -1], 2] = 1
+    # Low single-sample pulses on high signals
+    low = 1 - high
+    matrix = np.column_stack((high, low))
+    np.testing.assert_array_equal(engine(matrix, wsize), medfilt(matrix, wsize))
+
+
+@pytest.mark.filterwarnings("ignore:kernel_size exceeds volume extent")
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("wsize", WSIZES)
+def test_shorter_than_window(engine, wsize):
+    rng = np.random.default_rng(100 + wsize)
+    for length in range(1, wsize + 1):
+        matrix = random_matrix(rng, length)
+        matrix[:, 1] = 1
+        np.testing.assert_array_equal(engine(matrix, wsize), medfilt(matrix, wsize))
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import Configuration as cfg
+from replay_source import ReplaySource
+from signal_processor import SignalProcessor
+
+ENGINES = ["edges", "majority", "medfilt"]
+WSIZES = [1, 3, 5, 7, 15, 31]
+
+
+def random_signals(rng: np.random.Generator, length: int) -> pd.DataFrame:
+    """Random channels of short and long pulses with glitches, and constant ones."""
+    channels = []
+    for max_run in (3, 40, 1000):
+        levels = np.repeat(rng.integers(0, 2, length), rng.integers(1, max_run, length))
+        glitches = rng.random(length) < 0.02
+        channels.append(levels[:length] ^ glitches)
+    channels += [np.zeros(length), np.ones(length)]
+    matrix = np.column_stack(channels).astype(np.int8)
+    return pd.DataFrame(matrix, columns=[f"ch{i}" for i in range(matrix.shape[1])])
+
+
+def write_replay_source(signals_df: pd.DataFrame, path) -> ReplaySource:
+    """Write signals as a sigrok-cli binary capture of two-byte samples."""
+    bits = list(range(signals_df.shape[1]))
+    packed = np.zeros(len(signals_df), dtype="<u2")
+    for bit, col in zip(bits, signals_df.columns):
+        packed |= signals_df[col].to_numpy().astype("<u2") << bit
+    packed.tofile(path)
+    return ReplaySource(str(path), list(signals_df.columns), bits, unitsize=2)
+
+
+def assert_same_results(expected: SignalProcessor, actual: SignalProcessor) -> None:
+    """Check edges, pulses and glitch counts of two processors."""
+    for name in ("signal_edges", "filtered_edges"):
+        for field in ("positions", "offsets", "initial"):
+            np.testing.assert_array_equal(
+                getattr(getattr(actual, name), field),
+                getattr(getattr(expected, name), field),
+            )
+    np.testing.assert_array_equal(actual.pulse_table, expected.pulse_table)
+    np.testing.assert_array_equal(actual.rising, expected.rising)
+    np.testing.assert_array_equal(actual.glitches, expected.glitches)
+
+
+@pytest.fixture(autouse=True)
+def filter_config(monkeypatch):
+    """Restore the filter settings changed by the tests."""
+    for name in ("FILTER_WSIZE", "FILTER_ENGINE", "REPLAY_CHUNK_SIZE"):
+        monkeypatch.setattr(cfg, name, getattr(cfg, name))
+
+
+@pytest.mark.filterwarnings("ignore:kernel_size exceeds volume extent")
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("wsize", WSIZES)
+def test_random_windows(engine, wsize, tmp_path):
+    cfg.FILTER_ENGINE, cfg.FILTER_WSIZE = engine, wsize
+    rng = np.random.default_rng(wsize)
+    for trial, max_length in enumerate((50, 500, 3000, 5000)):
+        length = int(rng.integers(1, max_length))
+        signals_df = random_signals(rng, length)
+        source = write_replay_source(signals_df, tmp_path / f"{trial}.bin")
+        expected = SignalProcessor(signals_df)
+        # Windows shorter than pulses and than the capture, and on short
+        # captures shorter than the filter
+        chunk_sizes = {int(rng.integers(1, length + 1)), length}
+        if length <= 500:
+            chunk_sizes |= {1, max(wsize // 2, 1)}
+        for chunk_size in chunk_sizes:
+            actual = SignalProcessor.from_windows(
+                source.windows(chunk_size, wsize), source.columns, len(source)
+            )
+            assert_same_results(expected, actual)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_replay_source(engine, tmp_path):
+    cfg.FILTER_ENGINE, cfg.FILTER_WSIZE, cfg.REPLAY_CHUNK_SIZE = engine, 5, 700
+    signals_df = random_signals(np.random.default_rng(0), 10000)
+    source = write_replay_source(signals_df, tmp_path / "capture.bin")
+    assert_same_results(
+        SignalProcessor(signals_df), SignalProcessor.from_replay_source(source)
+    )
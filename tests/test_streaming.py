@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from config import Configuration as cfg
+from signal_processor import SignalProcessor, StreamingSignalProcessor
+from test_replay import ENGINES, WSIZES, random_signals
+
+
+def stream(signals_df: pd.DataFrame, block_sizes: list) -> tuple:
+    """
+    Feed signals block by block and finish.
+
+    :return: Streaming processor and all intervals it emitted.
+    """
+    processor = StreamingSignalProcessor(signals_df.columns)
+    runs, start = [], 0
+    for size in block_sizes:
+        runs.append(processor.feed(signals_df.iloc[start : start + size]))
+        start += size
+    runs.append(processor.finish())
+    return processor, np.concatenate(runs)
+
+
+def assert_same_pulses(expected: SignalProcessor, actual: tuple) -> None:
+    """Check pulses of the emitted intervals against the pulse table."""
+    processor, runs = actual
+    np.testing.assert_array_equal(processor.rising, expected.rising)
+    np.testing.assert_array_equal(processor.initial, expected.filtered_edges.initial)
+    assert processor.pulse_count == expected.pulse_count
+
+    pulses = runs[runs["level"] == processor.rising[runs["channel"]]]
+    pulses = pulses[np.lexsort((pulses["x1"], pulses["channel"]))]
+    for field in expected.pulse_table.dtype.names:
+        np.testing.assert_array_equal(pulses[field], expected.pulse_table[field])
+
+
+@pytest.fixture(autouse=True)
+def filter_config(monkeypatch):
+    """Restore the filter settings changed by the tests."""
+    for name in ("FILTER_WSIZE", "FILTER_ENGINE"):
+        monkeypatch.setattr(cfg, name, getattr(cfg, name))
+
+
+@pytest.mark.filterwarnings("ignore:kernel_size exceeds volume extent")
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("wsize", WSIZES)
+def test_random_blocks(engine, wsize):
+    cfg.FILTER_ENGINE, cfg.FILTER_WSIZE = engine, wsize
+    rng = np.random.default_rng(wsize)
+    for max_length in (50, 500, 3000, 5000):
+        length = int(rng.integers(1, max_length))
+        signals_df = random_signals(rng, length)
+        expected = SignalProcessor(signals_df)
+        # Blocks between random cuts: empty ones, ones shorter than pulses
+        # and, on short captures, ones shorter than the filter
+        mean_block = int(rng.integers(1, length + 1))
+        if length <= 500:
+            mean_block = min(mean_block, wsize)
+        cuts = np.sort(rng.integers(0, length + 1, length // mean_block + 1))
+        block_sizes = np.diff(cuts, prepend=0, append=length)
+        assert_same_pulses(expected, stream(signals_df, block_sizes.tolist()))
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_single_block(engine):
+    cfg.FILTER_ENGINE, cfg.FILTER_WSIZE = engine, 5
+    signals_df = random_signals(np.random.default_rng(0), 10000)
+    assert_same_pulses(SignalProcessor(signals_df), stream(signals_df, [10000]))
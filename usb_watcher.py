@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+    Developed by @edyatl <edyatl@yandex.ru> April 2024
+    https://github.com/edyatl
+
+"""
+
+# This file is part of the analyzer_reporter project
+
+import os
+import time
+import select
+
+from config import Configuration as cfg
+from logger import get_cls_logger
+
+
+class UsbWatcher:
+    """
+    Class to wait for USB storage changes.
+
+    The kernel flags ``/proc/mounts`` with POLLPRI | POLLERR whenever the
+    mount table changes, so mounts and unmounts wake the waiter right away.
+    Changes the mount table does not show, a drive plugged without mounting
+    or free space regained after files were deleted, are caught by cheap
+    device node and statvfs probes every USB_POLL_INTERVAL, and anything
+    else by a full rescan every USB_RESCAN_INTERVAL. Where mount events are
+    unavailable it falls back to a full rescan every USB_POLL_INTERVAL.
+    """
+
+    logger = get_cls_logger(__qualname__)
+
+    MOUNTS_FILE = "/proc/mounts"
+
+    def __init__(self):
+        self.usb_plugged = os.path.exists(cfg.USB_DRIVE)
+        self._mounts = None
+        self._poller = None
+
+        if cfg.USB_WATCH_EVENTS:
+            try:
+                self._mounts = open(self.MOUNTS_FILE, "rb")  # pylint: disable=R1732
+                self._mounts.read()
+                self._poller = select.poll()
+                self._poller.register(self._mounts, select.POLLPRI | select.POLLERR)
+            except (OSError, AttributeError) as e:
+                self.logger.warning("Mount events unavailable, polling: %s", e)
+                self.close()
+
+        self.logger.debug("Initialized %s", self.__class__.__name__)
+
+    def __enter__(self) -> "UsbWatcher":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+    @property
+    def event_driven(self) -> bool:
+        """Check if mount table events are watched."""
+        return self._poller is not None
+
+    def wait(self, mount_point: str = None) -> None:
+        """
+        Block until the USB storage should be rescanned.
+
+        :param mount_point: Mount point of the drive, if mounted, to probe
+            its free space.
+        """
+        if not self.event_driven:
+            time.sleep(cfg.USB_POLL_INTERVAL)
+            return
+
+        deadline = time.monotonic() + cfg.USB_RESCAN_INTERVAL
+        space_low = self._space_low(mount_point)
+        while time.monotonic() < deadline:
+            if self._poller.poll(cfg.USB_POLL_INTERVAL * 1000):
+                # Reading the table again rearms the event
+                self._mounts.seek(0)
+                self._mounts.read()
+                self.logger.debug("Mount table changed")
+                return
+
+            usb_plugged = os.path.exists(cfg.USB_DRIVE)
+            if usb_plugged != self.usb_plugged:
+                self.usb_plugged = usb_plugged
+                self.logger.debug("USB plugged: %s", usb_plugged)
+                return
+
+            if space_low and not self._space_low(mount_point):
+                self.logger.debug("Free space regained on %s", mount_point)
+                return
+
+    @staticmethod
+    def _space_low(mount_point: str) -> bool:
+        """Check if a mounted drive has no more than WRITE_TRESHOLD free."""
+        if mount_point is None:
+            return False
+        try:
+            statvfs = os.statvfs(mount_point)
+        except OSError:
+            return False
+        return statvfs.f_frsize * statvfs.f_bavail <= cfg.WRITE_TRESHOLD
+
+    def close(self) -> None:
+        """Stop watching the mount table."""
+        if self._mounts is not None:
+            self._mounts.close()
+        self._mounts = None
+        self._poller = None